@@ -1,12 +1,17 @@
 from django.contrib import admin
 
+from .deletion import (delete_orders,
+                       delete_order_items)
 from .models import (User,
                      Banner,
                      Category,
                      Product,
                      OrderItem,
                      OrderItemRelation,
-                     Order)
+                     Order,
+                     Campaign,
+                     ProductPrice,
+                     ArchivedOrder)
 
 
 class OrderItemAdmin(admin.ModelAdmin):
@@ -14,12 +19,50 @@ class OrderItemAdmin(admin.ModelAdmin):
         readonly_fields = ['user', 'total', 'status' ]
         return readonly_fields
 
+    def delete_model(self, request, obj):
+        delete_order_items([obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        delete_order_items(list(queryset.values_list('pk', flat=True)))
+
+
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ['name', 'percent', 'starts_at', 'ends_at', 'is_active']
+    filter_horizontal = ['products', 'categories']
+
+
+class ProductPriceAdmin(admin.ModelAdmin):
+    list_display = ['product', 'price', 'discount', 'campaign']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'sum_total', 'created_at', 'closed_at', 'archived_at']
+    list_filter = ['status']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 class OrderAdmin(admin.ModelAdmin):
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = ['user', 'sum_total', 'order_items']
         return readonly_fields
 
+    def delete_model(self, request, obj):
+        delete_orders([obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        delete_orders(list(queryset.values_list('pk', flat=True)))
+
 
 admin.site.register([User,
                      Banner,
@@ -27,4 +70,7 @@ admin.site.register([User,
                      Product,
                      OrderItemRelation])
 admin.site.register(OrderItem, OrderItemAdmin)
-admin.site.register(Order, OrderAdmin)
\ No newline at end of file
+admin.site.register(Order, OrderAdmin)
+admin.site.register(Campaign, CampaignAdmin)
+admin.site.register(ProductPrice, ProductPriceAdmin)
+admin.site.register(ArchivedOrder, ArchivedOrderAdmin)
@@ -0,0 +1,65 @@
+import json
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .deletion import delete_orders
+from .models import (ArchivedOrder,
+                     Order)
+from .serializers import (ArchivedOrderSerializer,
+                          OrderItemSerializer,
+                          OrderSerializer)
+
+
+ARCHIVED_STATUSES = [Order.Status.COMPLETED, Order.Status.CANCELED]
+
+
+def archive_lines(order):
+    data = OrderItemSerializer(order.order_items.all(), many=True).data
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def archive_orders(days, batch_size=500):
+    # Keyed on closed_at: created_at is auto_now and moves whenever a
+    # closed order is touched.
+    cutoff = timezone.now() - timedelta(days=days)
+    candidates = (Order.objects
+                  .filter(status__in=ARCHIVED_STATUSES, closed_at__lt=cutoff)
+                  .order_by('pk')
+                  .prefetch_related('order_items'))
+    archived = 0
+
+    while True:
+        with transaction.atomic():
+            orders = list(candidates[:batch_size])
+            if not orders:
+                break
+
+            ArchivedOrder.objects.bulk_create([ArchivedOrder(id=order.pk,
+                                                             user_id=order.user_id,
+                                                             created_at=order.created_at,
+                                                             closed_at=order.closed_at,
+                                                             sum_total=order.sum_total,
+                                                             status=order.status,
+                                                             order_items=archive_lines(order))
+                                               for order in orders])
+
+            delete_orders([order.pk for order in orders])
+
+        archived += len(orders)
+
+    return archived
+
+
+def order_history(user, statuses):
+    # Hot and archived orders share one id sequence, so merging on id
+    # keeps the original ordering.
+    orders = (Order.objects
+              .filter(user=user, status__in=statuses)
+              .prefetch_related('order_items'))
+    archived = ArchivedOrder.objects.filter(user=user, status__in=statuses)
+
+    history = OrderSerializer(orders, many=True).data + ArchivedOrderSerializer(archived, many=True).data
+    return sorted(history, key=lambda order: order['id'])
@@ -0,0 +1,377 @@
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.test import Client
+
+from .models import (Banner,
+                     Category,
+                     Product)
+
+
+SCENARIOS = {}
+
+
+def scenario(func=None, rollback=True):
+    # rollback=False scenarios run against committed data (e.g. when a
+    # separate server process has to see it); seeded rows are deleted after.
+    def register(func):
+        func.rollback = rollback
+        SCENARIOS[func.__name__] = func
+        return func
+
+    return register(func) if func else register
+
+
+def measure(func, repeat):
+    samples = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    return {'mean_ms': round(statistics.mean(samples), 3),
+            'p50_ms': round(samples[len(samples) // 2], 3),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3)}
+
+
+def seed_catalogue(products):
+    categories = [Category.objects.create(name_en=f'Category {number}', name_hu=f'Kategória {number}', queue=number)
+                  for number in range(max(products // 25, 1))]
+
+    for number in range(products):
+        Product.objects.create(name_en=f'Product {number}',
+                               name_hu=f'Termék {number}',
+                               description_en='Tomato sauce, mozzarella, basil and olive oil. ' * 4,
+                               description_hu='Paradicsomszósz, mozzarella, bazsalikom és olívaolaj. ' * 4,
+                               price=1000 + number,
+                               discount=number % 3 * 10,
+                               is_best=number % 5 == 0,
+                               thumbnail=f'images/products/thumbnails/{number}.webp',
+                               image=f'images/products/images/{number}.webp',
+                               category=categories[number % len(categories)])
+
+    banners = [Banner.objects.create(name_en=f'Banner {number}', name_hu=f'Reklám {number}', image=f'images/banners/{number}.jpg', queue=number)
+               for number in range(3)]
+
+    return categories + banners
+
+
+@scenario
+def payloads(repeat):
+    client = Client()
+    product = Product.objects.filter(is_active=True).first()
+    urls = {'menu': '/api/menu/',
+            'catalogue': '/api/catalogue/',
+            'banner': '/api/banner/'}
+    if product:
+        urls['product'] = f'/api/products/{product.pk}/product/'
+
+    variants = {'all': '',
+                'en': '?lang=en',
+                'hu': '?lang=hu',
+                'compact': '?compact=1',
+                'compact_en': '?compact=1&lang=en'}
+
+    rows = []
+    for name, url in urls.items():
+        for variant, query in variants.items():
+            target = url + query
+
+            cache.clear()
+            cold = measure(lambda: client.get(target), 1)
+            warm = measure(lambda: client.get(target), repeat)
+
+            rows.append({'endpoint': name,
+                         'variant': variant,
+                         'bytes': len(client.get(target).content),
+                         'cold_ms': cold['mean_ms'],
+                         **warm})
+
+    return rows
+
+
+@scenario
+def home(repeat):
+    client = Client()
+    separate = ['/api/banner/', '/api/catalogue_in_header/', '/api/new_product/', '/api/discount_product/']
+
+    def startup_calls():
+        for url in separate:
+            client.get(url)
+
+    rows = []
+    for name, func in [('separate', startup_calls), ('home', lambda: client.get('/api/home/'))]:
+        cache.clear()
+        cold = measure(func, 1)
+        warm = measure(func, repeat)
+        rows.append({'startup': name,
+                     'requests': len(separate) if name == 'separate' else 1,
+                     'cold_ms': cold['mean_ms'],
+                     **warm})
+
+    return rows
+
+
+@scenario
+def requests(repeat):
+    # Warm, cached endpoints: what is left is mostly middleware and DRF.
+    # Run once per settings profile to compare them.
+    client = Client()
+    rows = []
+
+    for url in ['/api/catalogue_in_header/', '/api/menu/', '/api/home/']:
+        client.get(url)
+        rows.append({'settings': settings.SETTINGS_MODULE,
+                     'middleware': len(settings.MIDDLEWARE) + len(getattr(settings, 'BROWSER_MIDDLEWARE', [])),
+                     'url': url,
+                     **measure(lambda: client.get(url), repeat)})
+
+    return rows
+
+
+@scenario
+def registration(repeat):
+    # Registering issues a verification code; never send it as an SMS.
+    from unittest import mock
+
+    with mock.patch('app.verification.send_sms'):
+        return register_users(repeat)
+
+
+def register_users(repeat):
+    client = Client()
+    counter = iter(range(10 ** 9))
+
+    def register():
+        number = next(counter)
+        client.post('/api/user/register/', {'username': f'bench-{number}', 'phone_number': f'+3699{number:07d}'})
+
+    client.post('/api/user/register/', {'username': 'bench-taken', 'phone_number': '+36989999999'})
+    duplicate = lambda: client.post('/api/user/register/', {'username': 'bench-taken', 'phone_number': '+36989999999'})
+
+    rows = []
+    for name, func in [('new', register), ('duplicate', duplicate)]:
+        result = measure(func, repeat)
+        rows.append({'registration': name,
+                     'per_second': round(1000 / result['mean_ms'], 1),
+                     **result})
+
+    return rows
+
+
+@scenario(rollback=False)
+def herd(repeat):
+    # A promo link: `repeat` concurrent requests for one product right
+    # after a catalogue change, once through the plain version-keyed
+    # cache and once through the coalescing one. The threads share the
+    # benchmark command's private in-memory cache, but each has its own
+    # database connection, so the product must be committed: seed with
+    # --products (deleted afterwards) or run against a loaded catalogue.
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import connection
+
+    from .catalogue import bump_catalogue_version, cached_payload, catalogue_version
+    from .serializers import ProductSerializer
+    from .singleflight import get_or_build
+
+    product = Product.objects.filter(is_active=True).first()
+    if product is None:
+        raise CommandError('herd needs an active product: load a catalogue or pass --products.')
+
+    clients = max(repeat, 2)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return ProductSerializer(Product.objects.get(pk=product.pk)).data
+
+    strategies = {'plain': lambda: cached_payload(f'herd:{product.pk}', None, build),
+                  'coalesced': lambda: get_or_build(f'herd:{product.pk}', catalogue_version(), build)}
+
+    rows = []
+    for name, fetch in strategies.items():
+        for state in ['cold', 'stale']:
+            cache.clear()
+            if state == 'stale':
+                fetch()
+                bump_catalogue_version()
+            builds.clear()
+            barrier = threading.Barrier(clients)
+
+            def request():
+                barrier.wait()
+                try:
+                    started = time.perf_counter()
+                    fetch()
+                    return (time.perf_counter() - started) * 1000
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(clients) as pool:
+                samples = sorted(pool.map(lambda _: request(), range(clients)))
+
+            rows.append({'cache': name,
+                         'state': state,
+                         'clients': clients,
+                         'builds': len(builds),
+                         'mean_ms': round(statistics.mean(samples), 3),
+                         'p95_ms': round(samples[min(clients - 1, int(clients * 0.95))], 3),
+                         'max_ms': round(samples[-1], 3)})
+
+    return rows
+
+
+@scenario
+def startup(repeat):
+    # Fresh interpreter per sample: import Django, set up the apps and load the URLconf.
+    code = ('import django; django.setup(); '
+            'from django.urls import get_resolver; get_resolver().url_patterns')
+    rows = []
+
+    for module in ['pizzapoint.settings', 'pizzapoint.settings_api']:
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': module}
+        run = lambda: subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, check=True)
+        rows.append({'settings': module,
+                     'modules': int(subprocess.run([sys.executable, '-c', code + '; import sys; print(len(sys.modules))'],
+                                                   cwd=settings.BASE_DIR, env=env, check=True,
+                                                   capture_output=True, text=True).stdout),
+                     **measure(run, max(repeat // 5, 3))})
+
+    return rows
+
+
+@scenario(rollback=False)
+def first_request(repeat):
+    # Fresh interpreter per sample, as a newly forked worker would be:
+    # latency of the first request to each endpoint, with and without
+    # app.warmup having run first.
+    code = ('import sys, time, django; django.setup(); '
+            'from django.test import Client; from app.warmup import warm_up; '
+            'warm_up() if sys.argv[1] == "warm" else None; '
+            'started = time.perf_counter(); Client().get(sys.argv[2]); '
+            'print((time.perf_counter() - started) * 1000)')
+    # The fresh interpreters keep a cache of their own, not the shared one.
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE, 'PIZZAPOINT_CACHE_URL': ''}
+    rows = []
+
+    for url in ['/api/menu/', '/api/catalogue_in_header/', '/api/home/']:
+        for state in ['cold', 'warm']:
+            samples = sorted(float(subprocess.run([sys.executable, '-c', code, state, url],
+                                                  cwd=settings.BASE_DIR, env=env, check=True,
+                                                  capture_output=True, text=True).stdout)
+                             for _ in range(max(repeat // 10, 3)))
+            rows.append({'url': url,
+                         'state': state,
+                         'first_ms': round(statistics.mean(samples), 3),
+                         'p50_ms': round(samples[len(samples) // 2], 3)})
+
+    return rows
+
+
+def hammer(host, port, urls, headers, deadline):
+    import http.client
+
+    done = 0
+    while time.monotonic() < deadline:
+        for url in urls:
+            connection = http.client.HTTPConnection(host, port, timeout=10)
+            connection.request('GET', url, headers=headers)
+            if connection.getresponse().status == 200:
+                done += 1
+            connection.close()
+    return done
+
+
+def wait_for_server(host, port, timeout=30):
+    import http.client
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request('GET', '/api/catalogue_in_header/')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on {host}:{port} did not start')
+
+
+@scenario(rollback=False)
+def throughput(repeat):
+    # Starts gunicorn (gunicorn.conf.py) with 1, 2, ... up to 2 * cores + 1
+    # workers and loads it from as many client processes for repeat / 10
+    # seconds per endpoint group. Order endpoints authenticate with a
+    # session cookie so password hashing does not dominate.
+    from concurrent.futures import ProcessPoolExecutor
+
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.sessions.backends.db import SessionStore
+
+    from .models import OrderItem, User
+
+    host, port = '127.0.0.1', 8765
+    duration = max(repeat / 10, 3)
+    cores = os.cpu_count() or 1
+
+    user = User.objects.create_user(username=f'benchmark-{os.getpid()}', phone_number=f'+bench{os.getpid()}')
+    for product in Product.objects.filter(is_active=True)[:5]:
+        OrderItem.objects.create(user=user, product=product, quantity=1)
+
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+
+    groups = {'catalogue': (['/api/menu/', '/api/catalogue_in_header/', '/api/banner/'], {}),
+              'orders': (['/api/order_items/', '/api/orders/'], {'Cookie': f'sessionid={session.session_key}'})}
+
+    # A throwaway shared cache: this process's cache is not the servers'.
+    cache_dir = tempfile.mkdtemp(prefix='pizzapoint-benchmark-')
+
+    rows = []
+    try:
+        for workers in sorted({1, 2, cores, cores * 2 + 1}):
+            env = {**os.environ,
+                   'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE,
+                   'PIZZAPOINT_CACHE_URL': f'file://{cache_dir}',
+                   'PIZZAPOINT_ALLOW_FILE_CACHE': '1',
+                   'PIZZAPOINT_WORKERS': str(workers),
+                   'PIZZAPOINT_BIND': f'{host}:{port}'}
+            server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+                                      cwd=settings.BASE_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_server(host, port)
+                clients = workers * 2
+                for group, (urls, headers) in groups.items():
+                    deadline = time.monotonic() + duration
+                    with ProcessPoolExecutor(clients) as pool:
+                        done = sum(pool.map(hammer, *zip(*[(host, port, urls, headers, deadline)] * clients)))
+                    rows.append({'workers': workers,
+                                 'clients': clients,
+                                 'endpoints': group,
+                                 'requests': done,
+                                 'req_per_s': round(done / duration, 1)})
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        session.delete()
+        user.delete()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return rows
@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models import Min, Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .catalogue import bump_catalogue_version
+from .changes import record_changes
+from .models import (Campaign,
+                     Product,
+                     ProductPrice,
+                     calculate_new_price)
+
+
+def active_campaigns(now=None):
+    now = now or timezone.now()
+    return Campaign.objects.filter(is_active=True, starts_at__lte=now, ends_at__gt=now)
+
+
+def next_boundary(now=None):
+    now = now or timezone.now()
+    upcoming = Campaign.objects.filter(is_active=True).aggregate(
+        starts_at=Min('starts_at', filter=Q(starts_at__gt=now)),
+        ends_at=Min('ends_at', filter=Q(ends_at__gt=now)),
+    )
+    boundaries = [boundary for boundary in upcoming.values() if boundary is not None]
+    return min(boundaries) if boundaries else None
+
+
+def campaign_discounts(now=None):
+    campaigns = active_campaigns(now)
+    discounts = {}
+
+    def offer(product_id, percent, campaign_id):
+        if percent > discounts.get(product_id, (0, None))[0]:
+            discounts[product_id] = (percent, campaign_id)
+
+    scoped_products = Campaign.products.through.objects.filter(campaign__in=campaigns)
+    for product_id, percent, campaign_id in scoped_products.values_list('product_id', 'campaign__percent', 'campaign_id'):
+        offer(product_id, percent, campaign_id)
+
+    scoped_categories = Product.objects.filter(category__campaigns__in=campaigns)
+    for product_id, percent, campaign_id in scoped_categories.values_list('pk', 'category__campaigns__percent', 'category__campaigns__id'):
+        offer(product_id, percent, campaign_id)
+
+    return discounts
+
+
+def effective_price(price, discount, campaign_discount):
+    # A campaign only applies when it beats the product's own discount.
+    percent, campaign_id = campaign_discount or (0, None)
+    if percent > discount:
+        return ProductPrice(price=calculate_new_price(price, percent), discount=percent, campaign_id=campaign_id)
+    if discount > 0:
+        return ProductPrice(price=calculate_new_price(price, discount), discount=discount)
+    return None
+
+
+def refresh_prices(now=None, bump=True):
+    discounts = campaign_discounts(now)
+    products = Product.objects.filter(Q(discount__gt=0) | Q(pk__in=list(discounts)))
+
+    prices = {}
+    for product_id, price, discount in products.values_list('pk', 'price', 'discount'):
+        product_price = effective_price(price, discount, discounts.get(product_id))
+        if product_price is not None:
+            product_price.product_id = product_id
+            prices[product_id] = product_price
+
+    with transaction.atomic():
+        # run_campaigns calls this every minute and most ticks change
+        # nothing, so only rows that differ are written.
+        existing = {price.product_id: price for price in ProductPrice.objects.select_for_update()}
+        removed = [product_id for product_id in existing if product_id not in prices]
+        added = [price for product_id, price in prices.items() if product_id not in existing]
+        updated = []
+        changed = removed + [price.product_id for price in added]
+
+        for product_id, price in prices.items():
+            old = existing.get(product_id)
+            if old is None or (old.price, old.discount, old.campaign_id) == (price.price, price.discount, price.campaign_id):
+                continue
+            if (old.price, old.discount) != (price.price, price.discount):
+                changed.append(product_id)
+            old.price, old.discount, old.campaign_id = price.price, price.discount, price.campaign_id
+            updated.append(old)
+
+        ProductPrice.objects.filter(product_id__in=removed).delete()
+        ProductPrice.objects.bulk_create(added, batch_size=500)
+        ProductPrice.objects.bulk_update(updated, ['price', 'discount', 'campaign'], batch_size=500)
+
+        # Products whose effective price moved show up in the sync change log.
+        changed.sort()
+        record_changes(Product, changed)
+
+    # Only a real change may throw the catalogue caches away (and pin
+    # catalogue reads to the primary).
+    if bump and changed:
+        bump_catalogue_version()
+
+    return len(prices)
+
+
+def refresh_product_price(product, now=None):
+    best = (active_campaigns(now)
+            .filter(Q(products=product) | Q(categories=product.category_id))
+            .order_by('-percent')
+            .values_list('percent', 'pk')
+            .first())
+
+    product_price = effective_price(product.price, product.discount, best)
+
+    if product_price is None:
+        ProductPrice.objects.filter(product=product).delete()
+    else:
+        ProductPrice.objects.update_or_create(product=product, defaults={'price': product_price.price,
+                                                                         'discount': product_price.discount,
+                                                                         'campaign_id': product_price.campaign_id})
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_product_price(instance)
+    # The one catalogue bump for a product save, after its price is current.
+    bump_catalogue_version()
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+@receiver(m2m_changed, sender=Campaign.products.through)
+@receiver(m2m_changed, sender=Campaign.categories.through)
+def campaigns_changed(sender, action=None, **kwargs):
+    if action in [None, 'post_add', 'post_remove', 'post_clear']:
+        transaction.on_commit(refresh_prices)
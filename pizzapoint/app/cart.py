@@ -0,0 +1,104 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from . import metrics
+from .models import (Order,
+                     OrderItem,
+                     Product)
+from .serializers import OrderItemSerializer
+from .signals import order_status_changed
+
+
+CART_CACHE_TTL = getattr(settings, 'CART_CACHE_TTL', 60 * 60 * 24)
+
+
+def generation_key(user_id):
+    return f'cart:generation:{user_id}'
+
+
+def initial_generation():
+    # Seeded from the clock so a generation lost to eviction never comes
+    # back at a number an older cart was stored under.
+    return time.time_ns() // 1000
+
+
+def cart_key(user_id, generation=None):
+    # Lines render from their own snapshots, so catalogue changes do not
+    # touch cached carts; only the user's own writes move the generation.
+    if generation is None:
+        generation = cache.get_or_set(generation_key(user_id), initial_generation, CART_CACHE_TTL)
+    return f'cart:{user_id}:{generation}'
+
+
+def build_cart(user_id):
+    order_items_objects = OrderItem.objects.filter(user_id=user_id, status__in=[OrderItem.Status.PENDING])
+
+    lines = OrderItemSerializer(order_items_objects, many=True).data
+    return {'order_items': lines,
+            'total': str(sum((Decimal(line['total']) for line in lines), Decimal('0')).quantize(Decimal('0.01')))}
+
+
+def get_cart(user_id):
+    # A read racing a write may store a cart built before the write, but
+    # under the generation the write has since moved past, so it is never
+    # read again.
+    key = cart_key(user_id)
+    cart = cache.get(key)
+    metrics.inc('cache_requests_total', cache='cart', result='miss' if cart is None else 'hit')
+
+    if cart is None:
+        cart = build_cart(user_id)
+        cache.set(key, cart, CART_CACHE_TTL)
+
+    return cart
+
+
+def bump_generation(user_id):
+    key = generation_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial_generation(), CART_CACHE_TTL)
+        return cache.incr(key)
+
+
+def write_through(user_id):
+    # The build starts after the bump: a write it misses commits later
+    # and moves the generation past this cart again.
+    generation = bump_generation(user_id)
+    cache.set(cart_key(user_id, generation), build_cart(user_id), CART_CACHE_TTL)
+
+
+def update_cart(user_id):
+    # After commit: bumped earlier, a concurrent read could build the old
+    # rows and store them under the new generation. The cart is rebuilt
+    # once there, so the read that follows the user's write is a hit.
+    transaction.on_commit(lambda: write_through(user_id))
+
+
+def invalidate_cart(user_id):
+    # For bulk deletions (e.g. abandoned carts) that nobody is about to
+    # read: the next read rebuilds instead.
+    transaction.on_commit(lambda: bump_generation(user_id))
+
+
+@receiver(order_status_changed, sender=Order)
+def order_created(sender, instance, old_status, **kwargs):
+    if old_status is None:
+        update_cart(instance.user_id)
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Ordered lines keep their snapshot (OrderItem.product is SET_NULL);
+    # lines still in a cart cannot be ordered any more, so they go.
+    lines = OrderItem.objects.filter(product=instance, status=OrderItem.Status.PENDING)
+    for user_id in set(lines.values_list('user_id', flat=True)):
+        invalidate_cart(user_id)
+    lines.delete()
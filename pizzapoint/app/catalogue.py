@@ -0,0 +1,142 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import metrics
+from .fieldsets import (fieldset_key,
+                        sparse_products)
+from .models import (Banner,
+                     Category,
+                     Product)
+from .routers import (CATALOGUE_PIN,
+                      pin)
+from .serializers import (BannerSerializer,
+                          CatalogueSerializer,
+                          CatalogueWithImageSerializer,
+                          MenuSerializer,
+                          ProductItemSerializer,
+                          ProductSerializer)
+from .singleflight import get_or_build
+
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+CATALOGUE_CACHE_TTL = getattr(settings, 'CATALOGUE_CACHE_TTL', 60 * 60)
+
+
+def initial_version():
+    # Seeded from the clock so a version key lost to eviction never
+    # restarts at a number that older cached payloads were stored under.
+    return time.time_ns() // 1000
+
+
+def catalogue_version():
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, initial_version, None)
+
+
+def bump_catalogue_version():
+    # Payloads for the new version must not be built from a lagging replica.
+    pin(CATALOGUE_PIN)
+    try:
+        return cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOGUE_VERSION_KEY, initial_version(), None)
+        return cache.incr(CATALOGUE_VERSION_KEY)
+
+
+def cached_payload(name, lang, build):
+    # Keys embed the catalogue version, so a bump orphans every cached
+    # payload at once and they simply age out of the cache.
+    key = f'catalogue:{catalogue_version()}:{name}:{lang or "all"}'
+    data = cache.get(key)
+    metrics.inc('cache_requests_total', cache='catalogue', result='miss' if data is None else 'hit')
+
+    if data is None:
+        data = build()
+        cache.set(key, data, CATALOGUE_CACHE_TTL)
+
+    return data
+
+
+def catalogue_in_header_payload(lang):
+
+    def build():
+        catalogue_objects = Category.objects.all().order_by('queue')
+        return CatalogueSerializer(catalogue_objects, many=True, context={'lang': lang}).data
+
+    return cached_payload('catalogue_in_header', lang, build)
+
+
+def catalogue_detail_payload(lang):
+
+    def build():
+        category_detail_objects = Category.objects.all().order_by('queue')
+        return CatalogueWithImageSerializer(category_detail_objects, many=True, context={'lang': lang}).data
+
+    return cached_payload('catalogue_detail', lang, build)
+
+
+def banner_payload(lang):
+
+    def build():
+        banner_objects = Banner.objects.all().order_by('queue')
+        return BannerSerializer(banner_objects, many=True, context={'lang': lang}).data
+
+    return cached_payload('banners', lang, build)
+
+
+def menu_payload(lang, fields=None):
+
+    def build():
+        menu_objects = Category.objects.all().order_by('queue').prefetch_related(Prefetch('products', queryset=sparse_products(Product.objects.all(), fields)))
+        return MenuSerializer(menu_objects, many=True, context={'lang': lang, 'fields': fields}).data
+
+    return cached_payload(fieldset_key('menu', fields), lang, build)
+
+
+def best_products_payload(lang, fields=None):
+
+    def build():
+        best_objects = sparse_products(Product.objects.filter(is_best=True, is_active=True), fields)
+        return ProductItemSerializer(best_objects, many=True, context={'lang': lang, 'fields': fields}).data
+
+    return cached_payload(fieldset_key('best_products', fields), lang, build)
+
+
+def discount_products_payload(lang, fields=None):
+
+    def build():
+        discount_objects = sparse_products(Product.objects.filter(effective_price__discount__gt=0, is_active=True), fields)
+        return ProductItemSerializer(discount_objects, many=True, context={'lang': lang, 'fields': fields}).data
+
+    return cached_payload(fieldset_key('discount_products', fields), lang, build)
+
+
+def product_payload(pk, lang, fields=None):
+
+    # None for a missing or inactive product; it is cached like a payload.
+    def build():
+        try:
+            product_objects = sparse_products(Product.objects.filter(is_active=True), fields).get(pk=pk)
+        except (Product.DoesNotExist, ValueError):
+            return None
+        return ProductSerializer(product_objects, context={'lang': lang, 'fields': fields}).data
+
+    # Not keyed by version: after a bump the old entry is served stale
+    # while a single request rebuilds it, instead of every request missing.
+    key = f'catalogue:{fieldset_key(f"product:{pk}", fields)}:{lang or "all"}'
+    return get_or_build(key, catalogue_version(), build, name='product')
+
+
+# Product saves are bumped by app.campaigns.product_saved, once the
+# effective price has been written too.
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Banner)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+def catalogue_changed(sender, **kwargs):
+    bump_catalogue_version()
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (Banner,
+                     Category,
+                     ChangeLog,
+                     Product)
+from .serializers import (SyncBannerSerializer,
+                          SyncCategorySerializer,
+                          SyncProductSerializer)
+
+
+CHANGES_PAGE_SIZE = getattr(settings, 'CHANGES_PAGE_SIZE', 500)
+
+SYNCED_MODELS = {ChangeLog.Model.BANNER: (Banner, SyncBannerSerializer, 'banners'),
+                 ChangeLog.Model.CATEGORY: (Category, SyncCategorySerializer, 'categories'),
+                 ChangeLog.Model.PRODUCT: (Product, SyncProductSerializer, 'products')}
+
+MODEL_NAMES = {Banner: ChangeLog.Model.BANNER,
+               Category: ChangeLog.Model.CATEGORY,
+               Product: ChangeLog.Model.PRODUCT}
+
+
+def record_changes(model, ids, action=ChangeLog.Action.UPSERT):
+    ChangeLog.objects.bulk_create([ChangeLog(model=MODEL_NAMES[model], object_id=object_id, action=action) for object_id in ids],
+                                  batch_size=500)
+
+
+def changes_since(since, lang=None):
+    entries = list(ChangeLog.objects.filter(pk__gt=since)
+                                    .order_by('pk')
+                                    .values_list('pk', 'model', 'object_id', 'action')[:CHANGES_PAGE_SIZE + 1])
+    more = len(entries) > CHANGES_PAGE_SIZE
+    entries = entries[:CHANGES_PAGE_SIZE]
+
+    # Only the last change to each object matters to the client.
+    latest = {}
+    for _, model, object_id, action in entries:
+        latest[model, object_id] = action
+
+    payload = {'sequence': entries[-1][0] if entries else since,
+               'more': more}
+    removed = {}
+
+    for name, (model, serializer, key) in SYNCED_MODELS.items():
+        ids = [object_id for (model_name, object_id), action in latest.items()
+               if model_name == name and action == ChangeLog.Action.UPSERT]
+        deleted = {object_id for (model_name, object_id), action in latest.items()
+                   if model_name == name and action == ChangeLog.Action.DELETE}
+
+        objects = model.objects.filter(pk__in=ids)
+        if model is Product:
+            objects = objects.select_related('effective_price')
+        objects = list(objects)
+
+        # Inactive products, and rows deleted after this page was logged,
+        # disappear from the client's menu just like deletions.
+        upserted = []
+        for obj in objects:
+            if getattr(obj, 'is_active', True):
+                upserted.append(obj)
+            else:
+                deleted.add(obj.pk)
+        deleted.update(set(ids) - {obj.pk for obj in objects})
+
+        payload[key] = serializer(upserted, many=True, context={'lang': lang}).data
+        removed[key] = sorted(deleted)
+
+    payload['deleted'] = removed
+    return payload
+
+
+def compact_changes():
+    # Dropping every entry but the newest per object keeps any client's
+    # next sync correct, whatever sequence it last saw.
+    latest = ChangeLog.objects.values('model', 'object_id').annotate(last=Max('pk')).values('last')
+    deleted, _ = ChangeLog.objects.exclude(pk__in=latest).delete()
+    return deleted
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+def object_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_changes(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Banner)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+def object_deleted(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], ChangeLog.Action.DELETE)
@@ -0,0 +1,27 @@
+class ConflictError(Exception):
+    pass
+
+
+def etag(instance):
+    return f'"{instance.version}"'
+
+
+def if_match_version(request):
+    # If-Match: "3" (or W/"3") pins the update to that version; * or a
+    # missing header means the version the request just loaded.
+    value = request.headers.get('If-Match', '').strip()
+    if value in ['', '*']:
+        return None
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        return -1
+
+
+def expect_version(instance, request):
+    # Version 0 (never issued) must still fail the check, so test for None.
+    version = if_match_version(request)
+    if version is not None:
+        instance.version = version
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cart import invalidate_cart
+from .models import (Order,
+                     OrderItem)
+
+
+def delete_orders(order_ids):
+    # Order's queryset takes the items with it (see OrderQuerySet.delete).
+    _, deleted = Order.objects.filter(pk__in=order_ids).delete()
+    return deleted.get(Order._meta.label, 0)
+
+
+def delete_order_items(item_ids):
+    with transaction.atomic():
+        user_ids = set(OrderItem.objects.filter(pk__in=item_ids, status=OrderItem.Status.PENDING)
+                                        .values_list('user_id', flat=True))
+
+        _, deleted = OrderItem.objects.filter(pk__in=item_ids).delete()
+
+    for user_id in user_ids:
+        invalidate_cart(user_id)
+
+    return deleted.get(OrderItem._meta.label, 0)
+
+
+def delete_abandoned_carts(days):
+    # OrderItem.created_at is auto_now: a cart line untouched for N days.
+    cutoff = timezone.now() - timedelta(days=days)
+    item_ids = list(OrderItem.objects.filter(status=OrderItem.Status.PENDING, created_at__lt=cutoff)
+                                     .values_list('pk', flat=True))
+    return delete_order_items(item_ids)
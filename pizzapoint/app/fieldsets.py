@@ -0,0 +1,52 @@
+PRODUCT_FIELDS = ['id',
+                  'name_en',
+                  'name_hu',
+                  'description_en',
+                  'description_hu',
+                  'thumbnail',
+                  'image',
+                  'is_best',
+                  'price',
+                  'discount',
+                  'new_price']
+
+COMPACT_PRODUCT_FIELDS = ['id',
+                          'name_en',
+                          'name_hu',
+                          'thumbnail']
+
+PRICE_FIELDS = ['discount',
+                'new_price']
+
+
+def requested_fields(request):
+    if request.query_params.get('compact') in ['1', 'true']:
+        return frozenset(COMPACT_PRODUCT_FIELDS)
+
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+
+    # Unknown names are ignored so the set of cacheable variants stays bounded.
+    return frozenset(field for field in fields.split(',') if field in PRODUCT_FIELDS) | {'id'}
+
+
+def fieldset_key(name, fields):
+    if fields is None:
+        return name
+    return f"{name}:{','.join(sorted(fields))}"
+
+
+def sparse_products(queryset, fields):
+    if fields is None:
+        return queryset.select_related('effective_price')
+
+    # is_active drives to_representation and category_id is needed to
+    # attach prefetched products to their category.
+    columns = {'id', 'is_active', 'category'} | (fields & set(PRODUCT_FIELDS))
+
+    if columns & set(PRICE_FIELDS):
+        columns |= {'price', 'discount', 'new_price', 'effective_price__price', 'effective_price__discount'}
+        return queryset.select_related('effective_price').only(*columns)
+
+    return queryset.only(*columns)
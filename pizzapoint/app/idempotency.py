@@ -0,0 +1,108 @@
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Keys live in the default cache, so duplicates are only caught between
+# processes that share it: with the per-process LocMem backend a retry
+# that lands on another worker runs again. Use Redis with more than one
+# worker (gunicorn.conf.py insists on it).
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENT_METHODS = ['POST', 'PATCH']
+
+# How long a finished response is replayed for, how long an in-flight
+# claim may live if its worker dies, and how long a concurrent duplicate
+# waits for the first request to finish before getting a 409.
+IDEMPOTENCY_TTL = getattr(settings, 'IDEMPOTENCY_TTL', 60 * 60 * 24)
+IDEMPOTENCY_LOCK_TTL = getattr(settings, 'IDEMPOTENCY_LOCK_TTL', 30)
+IDEMPOTENCY_WAIT = getattr(settings, 'IDEMPOTENCY_WAIT', 2)
+
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+
+
+def cache_key(request, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'idempotency:{request.user.pk}:{digest}'
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path} {body}'.encode()).hexdigest()
+
+
+def replay(record):
+    response = Response(record['data'], status=record['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def wait_for(key, request_fingerprint):
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+
+    while True:
+        record = cache.get(key)
+
+        if record is None:
+            return None
+        if record['fingerprint'] != request_fingerprint:
+            return Response({'error': 'Idempotency-Key was already used for a different request'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if record['state'] == DONE:
+            return replay(record)
+        if time.monotonic() >= deadline:
+            response = Response({'error': 'A request with this Idempotency-Key is still in progress'},
+                                status=status.HTTP_409_CONFLICT)
+            response['Retry-After'] = '1'
+            return response
+
+        time.sleep(0.05)
+
+
+def idempotent(view):
+
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+
+        if not key or request.method not in IDEMPOTENT_METHODS:
+            return view(self, request, *args, **kwargs)
+
+        if len(key) > 255:
+            return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = cache_key(request, key)
+        request_fingerprint = fingerprint(request)
+        claim = {'state': IN_PROGRESS, 'fingerprint': request_fingerprint}
+
+        # cache.add is atomic on Redis (and on LocMem within a process),
+        # so exactly one of several concurrent duplicates claims the key;
+        # the rest wait for its result.
+        while not cache.add(key, claim, IDEMPOTENCY_LOCK_TTL):
+            response = wait_for(key, request_fingerprint)
+            if response is not None:
+                return response
+
+        try:
+            response = view(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(key)
+            raise
+
+        if response.status_code >= 500 or getattr(response, 'streaming', False):
+            cache.delete(key)
+        else:
+            cache.set(key, {'state': DONE,
+                            'fingerprint': request_fingerprint,
+                            'status': response.status_code,
+                            'data': response.data}, IDEMPOTENCY_TTL)
+
+        return response
+
+    return wrapper
@@ -0,0 +1,38 @@
+from django.utils.cache import patch_vary_headers
+
+
+LANGUAGES = ['en', 'hu']
+
+
+def parse_accept_language(header):
+    weighted = []
+
+    for position, part in enumerate(header.split(',')):
+        tag, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        weighted.append((-quality, position, tag.split('-')[0].lower()))
+
+    return [tag for quality, position, tag in sorted(weighted) if quality < 0]
+
+
+def requested_language(request):
+    # Without an explicit choice the payload keeps both languages, as before.
+    lang = request.query_params.get('lang')
+    if lang in LANGUAGES:
+        return lang
+
+    for tag in parse_accept_language(request.headers.get('Accept-Language', '')):
+        if tag in LANGUAGES:
+            return tag
+
+    return None
+
+
+def vary_on_language(response):
+    patch_vary_headers(response, ['Accept-Language'])
+    return response
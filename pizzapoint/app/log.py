@@ -0,0 +1,123 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueListener
+
+from django.conf import settings
+
+
+SLOW_QUERY_MS = getattr(settings, 'SLOW_QUERY_MS', 200)
+SLOW_QUERY_SAMPLE_RATE = getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 0.1)
+SLOW_QUERY_STACK_DEPTH = 10
+
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed in extra=.
+RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+request_id = ContextVar('request_id', default=None)
+slow_query_logger = logging.getLogger('app.slow_query')
+
+
+def clean_request_id(value):
+    # Ids from the client are reused so their logs line up with ours, but
+    # only if they cannot smuggle anything into a log line.
+    if value and REQUEST_ID.match(value):
+        return value
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+
+    def filter(self, record):
+        # django.request logs error responses after the middleware has
+        # returned, but hands over the request itself.
+        record.request_id = request_id.get() or getattr(getattr(record, 'request', None), 'request_id', None)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+                'request_id': getattr(record, 'request_id', None)}
+
+        for key, value in vars(record).items():
+            if key not in RESERVED:
+                data[key] = value
+
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, default=str)
+
+
+class QueueHandler(logging.Handler):
+
+    # Formats the record in the calling thread (request ids live in
+    # context variables) and leaves the write to stderr to a background
+    # thread, so logging never blocks a request on the stream.
+    def __init__(self, stream=None):
+        super().__init__()
+        self.target = logging.StreamHandler(stream)
+        self.start()
+        # Threads do not survive a fork: every gunicorn worker needs a
+        # listener of its own.
+        os.register_at_fork(after_in_child=self.start)
+        atexit.register(self.stop)
+
+    def start(self):
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def stop(self):
+        self.listener.stop()
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+            record = copy.copy(record)
+            record.message = record.msg = message
+            record.args = record.exc_info = record.exc_text = record.stack_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+def stack_summary():
+    frames = [frame for frame in traceback.extract_stack()[:-2]
+              if frame.filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in frame.filename]
+    return [f'{os.path.relpath(frame.filename, settings.BASE_DIR)}:{frame.lineno} in {frame.name}'
+            for frame in frames[-SLOW_QUERY_STACK_DEPTH:]]
+
+
+def sample_slow_query(execute, sql, params, many, context):
+    # Parameters are left out: they carry phone numbers and the like.
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        if elapsed >= SLOW_QUERY_MS and random.random() < SLOW_QUERY_SAMPLE_RATE:
+            slow_query_logger.warning('Slow query took %.1f ms',
+                                      elapsed,
+                                      extra={'sql': sql,
+                                             'duration_ms': round(elapsed, 1),
+                                             'database': context['connection'].alias,
+                                             'stack': stack_summary()})
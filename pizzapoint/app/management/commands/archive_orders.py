@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move completed and canceled orders older than N days into the archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Archive orders last touched more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative.')
+
+        archived = archive_orders(options['days'], batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} orders.'))
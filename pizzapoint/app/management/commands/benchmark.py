@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from app.benchmarks import SCENARIOS, seed_catalogue
+from app.catalogue import bump_catalogue_version
+
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario. Seeded data is rolled back afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--products', type=int, default=0,
+                            help='Seed this many synthetic products before running.')
+
+    def handle(self, *args, **options):
+        run = SCENARIOS[options['scenario']]
+
+        # Scenarios clear and refill the cache at will, so they get a
+        # private one; the cache shared with the servers is never touched.
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            if run.rollback:
+                try:
+                    with transaction.atomic():
+                        if options['products']:
+                            seed_catalogue(options['products'])
+                        rows = run(options['repeat'])
+                        raise Rollback
+                except Rollback:
+                    pass
+                finally:
+                    cache.clear()
+            else:
+                seeded = seed_catalogue(options['products']) if options['products'] else []
+                try:
+                    rows = run(options['repeat'])
+                finally:
+                    for obj in seeded:
+                        obj.delete()
+                    cache.clear()
+
+        if not run.rollback and options['products']:
+            # Servers may have cached the committed seed data meanwhile.
+            bump_catalogue_version()
+
+        self.print_table(rows)
+
+    def print_table(self, rows):
+        if not rows:
+            return
+
+        columns = list(rows[0])
+        widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+
+        self.stdout.write('  '.join(column.ljust(widths[column]) for column in columns))
+        for row in rows:
+            self.stdout.write('  '.join(str(row[column]).ljust(widths[column]) for column in columns))
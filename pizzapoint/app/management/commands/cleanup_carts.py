@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.deletion import delete_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = 'Delete pending cart items that have not been touched for N days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Delete cart items untouched for more than this many days.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative.')
+
+        deleted = delete_abandoned_carts(options['days'])
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} abandoned cart items.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from app.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = 'Drop superseded catalogue change log entries, keeping the newest per object.'
+
+    def handle(self, *args, **options):
+        deleted = compact_changes()
+
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} superseded changes.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from app.exports import CONTENT_TYPES, export_rows, export_lines
+
+
+class Command(BaseCommand):
+    help = 'Stream orders and their items as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', default='csv', choices=sorted(CONTENT_TYPES))
+        parser.add_argument('--since', help='First day to export (YYYY-MM-DD).')
+        parser.add_argument('--until', help='Last day to export (YYYY-MM-DD).')
+        parser.add_argument('--output', help='File to write to instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = export_rows(since=self.parse(options['since']),
+                           until=self.parse(options['until']),
+                           chunk_size=options['chunk_size'])
+        lines = export_lines(options['type'], rows)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+    def parse(self, value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
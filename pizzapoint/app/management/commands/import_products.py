@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from app.product_import import ProductImportError, parse_rows, import_products
+
+
+class Command(BaseCommand):
+    help = 'Create or update products in bulk from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension.')
+        parser.add_argument('--dry-run', action='store_true', help='Report the diff without writing.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+
+        try:
+            with open(options['path'], 'rb') as source:
+                rows = parse_rows(source.read(), file_format)
+        except (OSError, ProductImportError) as error:
+            raise CommandError(error)
+
+        report = import_products(rows, dry_run=options['dry_run'])
+
+        self.stdout.write(json.dumps(report, cls=DjangoJSONEncoder, indent=2))
+
+        if report['errors']:
+            raise CommandError(f"{len(report['errors'])} rows failed validation, nothing was written.")
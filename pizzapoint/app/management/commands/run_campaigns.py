@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.campaigns import next_boundary, refresh_prices
+
+
+class Command(BaseCommand):
+    help = 'Materialize effective product prices at every campaign window boundary.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Refresh prices once and exit (for cron).')
+        parser.add_argument('--max-sleep', type=int, default=60,
+                            help='Upper bound in seconds between checks, so new campaigns are picked up.')
+
+    def handle(self, *args, **options):
+        while True:
+            now = timezone.now()
+            count = refresh_prices(now)
+            boundary = next_boundary(now)
+
+            self.stdout.write(f'{now.isoformat()} materialized {count} prices, next boundary: {boundary}')
+
+            if options['once']:
+                return
+
+            sleep = options['max_sleep']
+            if boundary is not None:
+                sleep = min(sleep, max((boundary - timezone.now()).total_seconds(), 0))
+            time.sleep(sleep)
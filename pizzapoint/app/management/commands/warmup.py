@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.warmup import WARMUP_STEPS, warm_up
+
+
+class Command(BaseCommand):
+    help = 'Import the app, open database connections and pre-render the catalogue payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--step', action='append', choices=list(WARMUP_STEPS),
+                            help='Run only this step (repeatable). Defaults to all of them.')
+
+    def handle(self, *args, **options):
+        timings = warm_up(options['step'])
+
+        for name, elapsed in timings.items():
+            self.stdout.write(f'{name:<12} {elapsed} ms')
+        self.stdout.write(self.style.SUCCESS(f'Warmed up in {round(sum(timings.values()), 2)} ms.'))
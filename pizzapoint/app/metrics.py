@@ -0,0 +1,274 @@
+import hmac
+import json
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from .models import Order
+from .signals import order_status_changed
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Each process counts into plain dicts of its own (no locks, no shared
+# memory) and every METRICS_FLUSH_INTERVAL seconds writes a snapshot to
+# METRICS_DIR. The /metrics endpoint sums the snapshots of all workers.
+METRICS_DIR = getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'pizzapoint-metrics'))
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+METRICS_ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+
+PROXY_HEADERS = ['HTTP_X_FORWARDED_FOR', 'HTTP_X_REAL_IP', 'HTTP_FORWARDED']
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+RETIRED = 'retired.json'
+
+HELP = {
+    'http_requests_total': 'HTTP requests by endpoint, method and status.',
+    'http_request_duration_seconds': 'HTTP request latency by endpoint.',
+    'db_queries_total': 'Database queries by endpoint.',
+    'cache_requests_total': 'Application cache lookups by cache and result.',
+    'orders_created_total': 'Orders created.',
+    'order_status_transitions_total': 'Order status changes.',
+}
+
+counters = defaultdict(lambda: defaultdict(float))
+histograms = defaultdict(dict)
+last_flush = 0
+snapshot_name = None
+
+
+def reset():
+    global last_flush, snapshot_name
+    counters.clear()
+    histograms.clear()
+    last_flush = 0
+    snapshot_name = None
+
+
+# A forked worker starts with empty counters rather than a copy of the master's.
+os.register_at_fork(after_in_child=reset)
+
+
+def label_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    counters[name][label_key(labels)] += amount
+
+
+def observe(name, value, **labels):
+    key = label_key(labels)
+    series = histograms[name].get(key)
+    if series is None:
+        series = histograms[name][key] = {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0, 'count': 0}
+    series['buckets'][bisect_left(BUCKETS, value)] += 1
+    series['sum'] += value
+    series['count'] += 1
+
+
+def snapshot():
+    return {'counters': counters, 'histograms': histograms}
+
+
+def write_json(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def process_start(pid):
+    # Start time in clock ticks since boot (field 22 of /proc/<pid>/stat),
+    # or None where there is no /proc.
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            stat = file.read()
+    except OSError:
+        return None
+    return stat.rsplit(')', 1)[1].split()[19]
+
+
+def worker_id(pid):
+    # PIDs get reused, so a snapshot is keyed by PID and start time: a new
+    # process with an old PID does not inherit the old process's file.
+    start = process_start(pid)
+    return f'{pid}-{start}' if start else str(pid)
+
+
+def flush(force=False):
+    global last_flush, snapshot_name
+    now = time.monotonic()
+    if not force and now - last_flush < METRICS_FLUSH_INTERVAL:
+        return
+    last_flush = now
+    if snapshot_name is None:
+        snapshot_name = f'{worker_id(os.getpid())}.json'
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    write_json(os.path.join(METRICS_DIR, snapshot_name), snapshot())
+
+
+def merge(total, data):
+    for name, series in data['counters'].items():
+        for key, value in series.items():
+            total['counters'].setdefault(name, {})
+            total['counters'][name][key] = total['counters'][name].get(key, 0) + value
+
+    for name, series in data['histograms'].items():
+        for key, value in series.items():
+            merged = total['histograms'].setdefault(name, {}).setdefault(key, {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0, 'count': 0})
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], value['buckets'])]
+            merged['sum'] += value['sum']
+            merged['count'] += value['count']
+
+    return total
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_running(worker):
+    pid = worker.partition('-')[0]
+    if not pid.isdigit():
+        return False
+    return is_alive(int(pid)) and worker_id(int(pid)) == worker
+
+
+def read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def retire_dead_workers():
+    # Fold snapshots of exited workers (max_requests recycles them) into
+    # one file so the directory stays small and the totals keep counting up.
+    retired_path = os.path.join(METRICS_DIR, RETIRED)
+    dead = [name for name in os.listdir(METRICS_DIR)
+            if name.endswith('.json') and name != RETIRED and not is_running(name[:-len('.json')])]
+    if not dead:
+        return 0
+
+    retired = read_json(retired_path) or {'counters': {}, 'histograms': {}}
+    for name in dead:
+        data = read_json(os.path.join(METRICS_DIR, name))
+        if data is not None:
+            merge(retired, data)
+    write_json(retired_path, retired)
+    for name in dead:
+        os.remove(os.path.join(METRICS_DIR, name))
+    return len(dead)
+
+
+def read_all():
+    total = {'counters': {}, 'histograms': {}}
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith('.json'):
+            data = read_json(os.path.join(METRICS_DIR, name))
+            if data is not None:
+                merge(total, data)
+    return total
+
+
+@contextmanager
+def locked():
+    with open(os.path.join(METRICS_DIR, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def collect():
+    flush(force=True)
+
+    # Without flock (Windows) dead workers' files are simply kept.
+    if fcntl is None:
+        return read_all()
+
+    with locked():
+        retire_dead_workers()
+        return read_all()
+
+
+def prune():
+    # Called by the gunicorn master before it forks any worker, so files
+    # left behind by a previous run are retired before their PIDs come
+    # around again.
+    if fcntl is None:
+        return 0
+
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with locked():
+        return retire_dead_workers()
+
+
+def scrape_allowed(request):
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+
+    # Requests relayed by a reverse proxy on this host also come from
+    # 127.0.0.1; only direct connections from the allowed addresses count.
+    if any(header in request.META for header in PROXY_HEADERS):
+        return False
+    return request.META.get('REMOTE_ADDR') in METRICS_ALLOWED_IPS
+
+
+def format_labels(key, **extra):
+    labels = [(name, str(value)) for name, value in json.loads(key) + list(extra.items())]
+    if not labels:
+        return ''
+    escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def number(value):
+    return repr(int(value)) if value == int(value) else repr(value)
+
+
+def exposition(total):
+    lines = []
+
+    for name, series in sorted(total['counters'].items()):
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} counter')
+        for key, value in sorted(series.items()):
+            lines.append(f'{name}{format_labels(key)} {number(value)}')
+
+    for name, series in sorted(total['histograms'].items()):
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, value in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ['+Inf'], value['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(key, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(key)} {number(value["sum"])}')
+            lines.append(f'{name}_count{format_labels(key)} {value["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+@receiver(order_status_changed, sender=Order)
+def count_order_status(sender, instance, old_status, new_status, **kwargs):
+    if old_status is None:
+        inc('orders_created_total')
+    else:
+        inc('order_status_transitions_total', **{'from': old_status, 'to': new_status})
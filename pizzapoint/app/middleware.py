@@ -0,0 +1,115 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from . import log, metrics
+
+
+class BrowserOnlyMiddleware:
+
+    # Runs settings.BROWSER_MIDDLEWARE (CSRF, clickjacking...) for admin
+    # and other browser routes only; requests under settings.API_PREFIX go
+    # straight to the view. Django only calls the view and exception hooks
+    # of middleware listed in MIDDLEWARE, so they are forwarded from here
+    # (CsrfViewMiddleware does its checking in process_view).
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.api_prefix = getattr(settings, 'API_PREFIX', '/api/')
+
+        handler = get_response
+        middleware = []
+        for path in reversed(getattr(settings, 'BROWSER_MIDDLEWARE', [])):
+            handler = import_string(path)(handler)
+            middleware.insert(0, handler)
+        self.browser_handler = handler
+
+        self.view_hooks = [mw.process_view for mw in middleware if hasattr(mw, 'process_view')]
+        self.exception_hooks = [mw.process_exception for mw in reversed(middleware) if hasattr(mw, 'process_exception')]
+
+    def is_api(self, request):
+        return request.path_info.startswith(self.api_prefix)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.get_response(request)
+        return self.browser_handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_api(request):
+            return None
+        for hook in self.view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_exception(self, request, exception):
+        if self.is_api(request):
+            return None
+        for hook in self.exception_hooks:
+            response = hook(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
+class MetricsMiddleware:
+
+    # Outermost middleware: counts every request, its latency and the
+    # database queries it ran, labelled by URL name to keep series bounded.
+    METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.view_name if match else 'unmatched'
+        method = request.method if request.method in self.METHODS else 'other'
+
+        metrics.inc('http_requests_total', endpoint=endpoint, method=method, status=response.status_code)
+        metrics.observe('http_request_duration_seconds', elapsed, endpoint=endpoint)
+        metrics.inc('db_queries_total', queries, endpoint=endpoint)
+        metrics.flush()
+
+        return response
+
+
+class RequestLogMiddleware:
+
+    # Gives every request a correlation id (the client's X-Request-ID or
+    # a new one) that log records pick up through app.log.RequestIdFilter,
+    # and samples queries slower than settings.SLOW_QUERY_MS.
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.request_id = log.clean_request_id(request.headers.get('X-Request-ID'))
+        token = log.request_id.set(request.request_id)
+        try:
+            with ExitStack() as stack:
+                if log.SLOW_QUERY_SAMPLE_RATE > 0:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(log.sample_slow_query))
+                response = self.get_response(request)
+            response['X-Request-ID'] = request.request_id
+            return response
+        finally:
+            log.request_id.reset(token)
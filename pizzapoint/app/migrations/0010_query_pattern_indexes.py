@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(fields=['queue'], name='banner_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['queue'], name='category_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['user', 'status'], name='orderitem_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_best', True)), fields=['is_best'], name='product_best_idx'),
+        ),
+    ]
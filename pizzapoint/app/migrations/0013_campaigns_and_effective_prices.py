@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:35
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def materialize_static_discounts(apps, schema_editor):
+    Product = apps.get_model('app', 'Product')
+    ProductPrice = apps.get_model('app', 'ProductPrice')
+
+    ProductPrice.objects.bulk_create(
+        ProductPrice(product_id=product_id, price=new_price, discount=discount)
+        for product_id, new_price, discount in Product.objects.filter(discount__gt=0).values_list('pk', 'new_price', 'discount')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_order_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Campaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('percent', models.PositiveIntegerField(validators=[django.core.validators.MaxValueValidator(100)])),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('categories', models.ManyToManyField(blank=True, related_name='campaigns', to='app.category')),
+                ('products', models.ManyToManyField(blank=True, related_name='campaigns', to='app.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='effective_price', serialize=False, to='app.product')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount', models.PositiveIntegerField()),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prices', to='app.campaign')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['starts_at', 'ends_at'], name='campaign_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productprice',
+            index=models.Index(fields=['discount'], name='productprice_discount_idx'),
+        ),
+        migrations.RunPython(materialize_static_discounts, migrations.RunPython.noop),
+    ]
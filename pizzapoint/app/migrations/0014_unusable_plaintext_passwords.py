@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:48
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import migrations
+
+
+def make_plaintext_passwords_unusable(apps, schema_editor):
+    # Older accounts were saved with a random plaintext password that
+    # nothing ever checked; replace those with unusable ones.
+    User = apps.get_model('app', 'User')
+
+    users = []
+    for user in User.objects.exclude(password__startswith='!').only('id', 'password').iterator():
+        try:
+            identify_hasher(user.password)
+        except ValueError:
+            user.password = make_password(None)
+            users.append(user)
+
+    User.objects.bulk_update(users, ['password'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_campaigns_and_effective_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(make_plaintext_passwords_unusable, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_archived_orders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
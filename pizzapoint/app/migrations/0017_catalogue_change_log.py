@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:01
+
+from django.db import migrations, models
+
+
+def log_existing_catalogue(apps, schema_editor):
+    # Clients syncing from sequence 0 get the catalogue as it stands today.
+    ChangeLog = apps.get_model('app', 'ChangeLog')
+
+    for model, name in [('Category', 'category'), ('Banner', 'banner'), ('Product', 'product')]:
+        ids = apps.get_model('app', model).objects.values_list('pk', flat=True)
+        ChangeLog.objects.bulk_create([ChangeLog(model=name, object_id=object_id, action='upsert') for object_id in ids],
+                                      batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_order_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('banner', 'Banner'), ('category', 'Category'), ('product', 'Product')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id'], name='changelog_object_idx')],
+            },
+        ),
+        migrations.RunPython(log_existing_catalogue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:06
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def snapshot_order_items(apps, schema_editor):
+    # Lines already in an order keep what they were charged (total is
+    # what the customer saw); pending lines take today's effective price.
+    OrderItem = apps.get_model('app', 'OrderItem')
+    ProductPrice = apps.get_model('app', 'ProductPrice')
+
+    effective = {price.product_id: price for price in ProductPrice.objects.all()}
+
+    items = []
+    for item in OrderItem.objects.filter(unit_price=None).exclude(product=None).select_related('product').iterator():
+        product = item.product
+        price = effective.get(product.pk)
+
+        if item.status != 'Pending' and item.quantity:
+            item.unit_price = (item.total / item.quantity).quantize(Decimal('0.01'))
+        else:
+            item.unit_price = price.price if price is not None else product.new_price
+        item.product_price = product.price
+        item.product_discount = price.discount if price is not None else product.discount
+        item.product_name_en = product.name_en
+        item.product_name_hu = product.name_hu
+        item.product_thumbnail = product.thumbnail.name
+        items.append(item)
+
+    OrderItem.objects.bulk_update(items,
+                                  ['unit_price',
+                                   'product_price',
+                                   'product_discount',
+                                   'product_name_en',
+                                   'product_name_hu',
+                                   'product_thumbnail'],
+                                  batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_catalogue_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_discount',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name_en',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name_hu',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=15, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_thumbnail',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(snapshot_order_items, migrations.RunPython.noop),
+    ]
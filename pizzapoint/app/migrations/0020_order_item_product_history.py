@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_is_best(apps, schema_editor):
+    OrderItem = apps.get_model('app', 'OrderItem')
+    Product = apps.get_model('app', 'Product')
+
+    OrderItem.objects.exclude(product=None).update(
+        product_is_best=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('is_best')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_archived_order_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_is_best',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(snapshot_is_best, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='product', to='app.product'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:42
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_closed_at(apps, schema_editor):
+    # The best guess for rows closed before closed_at existed is the last
+    # time they were touched.
+    Order = apps.get_model('app', 'Order')
+    ArchivedOrder = apps.get_model('app', 'ArchivedOrder')
+
+    Order.objects.filter(status__in=['Completed', 'Canceled']).update(closed_at=F('created_at'))
+    ArchivedOrder.objects.update(closed_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_order_item_product_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='closed_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_closed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['closed_at'], name='archived_order_closed_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['closed_at'], name='order_closed_at_idx'),
+        ),
+    ]
@@ -1,18 +1,17 @@
-import random
 from django.db import transaction
-import string
-from django.db.models import Sum
+from django.db.models import F, Sum, Q
 from django.contrib.auth.models import (AbstractUser,
                                         User)
 from django.db import models
 from decimal import Decimal
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import m2m_changed
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
-from django.db.models.signals import pre_delete
-from django.dispatch import receiver
-from threading import local
+
+from .concurrency import ConflictError
+from .signals import order_status_changed
 
 
 class User(AbstractUser):
@@ -24,13 +23,11 @@ class User(AbstractUser):
     password = models.CharField(max_length=255,
                                 blank=True)
 
-    def generate_random_password(self, length=12):
-        characters = string.ascii_letters + string.digits
-        password = ''.join(random.choice(characters) for _ in range(length))
-        return password
     def save(self, *args, **kwargs):
+        # Phone-only accounts never log in with a password; an unusable
+        # one costs no hashing and cannot be guessed.
         if not self.password:
-            self.password = self.generate_random_password()
+            self.set_unusable_password()
         super().save(*args, **kwargs)
     def __str__(self):
         return self.username
@@ -42,6 +39,11 @@ class Banner(models.Model):
     image = models.ImageField(upload_to='images/banners/')
     queue = models.IntegerField(null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['queue'], name='banner_queue_idx'),
+        ]
+
     def __str__(self):
         return self.name_en
 
@@ -52,10 +54,20 @@ class Category(models.Model):
     image = models.ImageField(upload_to='images/categories', blank=True)
     queue = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['queue'], name='category_queue_idx'),
+        ]
+
     def __str__(self):
         return self.name_en
 
 
+def calculate_new_price(price, discount):
+    result = price * (100 - discount) / 100
+    return Decimal(result).quantize(Decimal('0.1'))
+
+
 class Product(models.Model):
     name_en = models.CharField(max_length=100)
     name_hu = models.CharField(max_length=100)
@@ -70,18 +82,98 @@ class Product(models.Model):
     image = models.ImageField(upload_to='images/products/images')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
 
+    class Meta:
+        indexes = [
+            # Holds exactly the rows the best-products listing shows.
+            models.Index(fields=['is_best'], name='product_best_idx', condition=Q(is_active=True, is_best=True)),
+        ]
+
     def save(self, *args, **kwargs):
-        result = self.price * (100 - self.discount) / 100
-        self.new_price = Decimal(result).quantize(Decimal('0.1'))
+        self.new_price = calculate_new_price(self.price, self.discount)
         super().save(*args, **kwargs)
 
+    def current_price(self):
+        effective_price = getattr(self, 'effective_price', None)
+        if effective_price is not None:
+            return effective_price.price
+        return self.new_price
+
+    def current_discount(self):
+        effective_price = getattr(self, 'effective_price', None)
+        if effective_price is not None:
+            return effective_price.discount
+        return self.discount
+
     def __str__(self):
         return self.name_en
 
 
+class Campaign(models.Model):
+    name = models.CharField(max_length=100)
+    percent = models.PositiveIntegerField(validators=[MaxValueValidator(100)])
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    products = models.ManyToManyField(Product, related_name='campaigns', blank=True)
+    categories = models.ManyToManyField(Category, related_name='campaigns', blank=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['starts_at', 'ends_at'], name='campaign_window_idx', condition=Q(is_active=True)),
+        ]
+
+    def clean(self):
+        if self.starts_at and self.ends_at and self.starts_at >= self.ends_at:
+            raise ValidationError(_("Campaign must end after it starts."))
+
+    def __str__(self):
+        return self.name
+
+
+class ProductPrice(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='effective_price')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount = models.PositiveIntegerField()
+    campaign = models.ForeignKey(Campaign, on_delete=models.SET_NULL, null=True, blank=True, related_name='prices')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['discount'], name='productprice_discount_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product} {self.price}'
 
 
-class OrderItem(models.Model):
+class VersionedModel(models.Model):
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        self.expected_version = self.version
+        self.version += 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        try:
+            super().save(*args, **kwargs)
+        except ConflictError:
+            self.version = self.expected_version
+            raise
+
+    def _do_update(self, base_qs, *args, **kwargs):
+        # UPDATE ... WHERE id = %s AND version = %s: a row changed since
+        # this instance was loaded matches nothing and the save fails.
+        if super()._do_update(base_qs.filter(version=self.expected_version), *args, **kwargs):
+            return True
+        raise ConflictError(f'{self._meta.object_name} {self.pk} was changed by someone else.')
+
+
+class OrderItem(VersionedModel):
 
     class Status(models.TextChoices):
         PENDING = 'Pending', 'Pending'
@@ -90,14 +182,41 @@ class OrderItem(models.Model):
         CANCELED = 'Canceled', 'Canceled'
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, editable=False)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, related_name='product')
+    # SET_NULL: deleting a product must not delete the order history.
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='product')
     created_at = models.DateTimeField(auto_now=True, auto_now_add=False)
     quantity = models.PositiveIntegerField(validators=[MaxValueValidator(100)])
     total = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, editable=False)
     status = models.CharField(max_length=50, choices=Status.choices, default=Status.PENDING, editable=False)
 
+    # What the product looked like when the line was created; history is
+    # rendered from these, not from today's product.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
+    product_price = models.DecimalField(max_digits=15, decimal_places=2, null=True, editable=False)
+    product_discount = models.PositiveIntegerField(default=0, editable=False)
+    product_name_en = models.CharField(max_length=100, blank=True, editable=False)
+    product_name_hu = models.CharField(max_length=100, blank=True, editable=False)
+    product_thumbnail = models.CharField(max_length=100, blank=True, editable=False)
+    product_is_best = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='orderitem_user_status_idx'),
+        ]
+
+    def snapshot_product(self):
+        self.unit_price = self.product.current_price()
+        self.product_price = self.product.price
+        self.product_discount = self.product.current_discount()
+        self.product_name_en = self.product.name_en
+        self.product_name_hu = self.product.name_hu
+        self.product_thumbnail = self.product.thumbnail.name
+        self.product_is_best = self.product.is_best
+
     def save(self, *args, **kwargs):
-        result = self.quantity * self.product.new_price
+        if self.unit_price is None:
+            self.snapshot_product()
+        result = self.quantity * self.unit_price
         self.total = Decimal(result).quantize(Decimal('0.1'))
         super().save(*args, **kwargs)
 
@@ -108,18 +227,36 @@ class OrderItem(models.Model):
         return self.user.username
 
 
+class OrderItemRelationQuerySet(models.QuerySet):
+
+    def delete(self):
+        # An item belongs to its relation: deleting the items cascades to
+        # the relations, in one statement per table rather than per row.
+        with transaction.atomic():
+            item_ids = list(self.values_list('order_item_id', flat=True))
+            return OrderItem.objects.filter(pk__in=item_ids).delete()
+
+
 class OrderItemRelation(models.Model):
     order = models.ForeignKey('Order', on_delete=models.CASCADE)
     order_item = models.ForeignKey('OrderItem', on_delete=models.CASCADE)
 
+    objects = OrderItemRelationQuerySet.as_manager()
+
     def delete(self, *args, **kwargs):
-        print(f"Deleting OrderItemRelation ID: {self.id}")
-        if self.order_item:
-            print(f"Deleting associated OrderItem ID: {self.order_item.id}")
-        super().delete(*args, **kwargs)
+        return OrderItemRelation.objects.filter(pk=self.pk).delete()
+
+
+class OrderQuerySet(models.QuerySet):
 
+    def delete(self):
+        # Orders own their items; the relations cascade with both.
+        with transaction.atomic():
+            OrderItem.objects.filter(order_items__in=self).delete()
+            return super().delete()
 
-class Order(models.Model):
+
+class Order(VersionedModel):
 
     class Status(models.TextChoices):
         ACTIVE = 'Active', 'Active'
@@ -128,39 +265,163 @@ class Order(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user', editable=False)
     created_at = models.DateTimeField(auto_now=True, auto_now_add=False)
+    # created_at is auto_now; closed_at is set once, when the order is
+    # completed or canceled, and never moves after that.
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False)
     sum_total = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     order_items = models.ManyToManyField(OrderItem, related_name='order_items', through='OrderItemRelation', blank=True, editable=False)
     status = models.CharField(max_length=50, choices=Status.choices, default=Status.ACTIVE)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            models.Index(fields=['created_at'], name='order_created_at_idx'),
+            models.Index(fields=['closed_at'], name='order_closed_at_idx'),
+        ]
 
 
     def save(self, *args, **kwargs):
 
         self.full_clean()
 
+        if self.status in [Order.Status.COMPLETED, Order.Status.CANCELED] and not self.closed_at:
+            self.closed_at = timezone.now()
+
         if not self.pk:
-            pending_items = OrderItem.objects.filter(status=OrderItem.Status.PENDING)
+            pending_items = OrderItem.objects.filter(user=self.user, status=OrderItem.Status.PENDING)
             if not pending_items.exists():
                 raise ValidationError("No pending OrderItems available to assign a user.")
             super().save(*args, **kwargs)
+            self.loaded_status = self.status
             self.order_items.set(pending_items)
-            self.order_items.update(status=self.status)
+            self.order_items.update(status=self.status, version=F('version') + 1)
+            order_status_changed.send(sender=Order, instance=self, old_status=None, new_status=self.status)
         else:
-            current_status = Order.objects.get(pk=self.pk).status
+            # The versioned UPDATE guarantees the row still has the status
+            # it was loaded with, so no fresh SELECT is needed to check it.
+            current_status = getattr(self, 'loaded_status', None) or Order.objects.values_list('status', flat=True).get(pk=self.pk)
             if current_status in [Order.Status.COMPLETED, Order.Status.CANCELED]:
                 raise ValidationError(
                     _("You cannot modify completed or canceled orders.")
                 )
             super().save(*args, **kwargs)
-            self.order_items.update(status=self.status)
+            self.loaded_status = self.status
+            if current_status != self.status:
+                self.order_items.update(status=self.status, version=F('version') + 1)
+                order_status_changed.send(sender=Order, instance=self, old_status=current_status, new_status=self.status)
 
     
 
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance.loaded_status = instance.status
+        return instance
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            self.order_items.all().delete()
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return self.user.username
     
 
+class ChangeLog(models.Model):
+
+    # The id doubles as the sync sequence handed to clients.
+    class Model(models.TextChoices):
+        BANNER = 'banner', 'Banner'
+        CATEGORY = 'category', 'Category'
+        PRODUCT = 'product', 'Product'
+
+    class Action(models.TextChoices):
+        UPSERT = 'upsert', 'Upsert'
+        DELETE = 'delete', 'Delete'
+
+    model = models.CharField(max_length=20, choices=Model.choices)
+    object_id = models.PositiveBigIntegerField()
+    action = models.CharField(max_length=10, choices=Action.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id'], name='changelog_object_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.pk} {self.action} {self.model} {self.object_id}'
+
+
+class ArchivedOrder(models.Model):
+    # Same id as the Order it replaced; item lines are kept as the
+    # serialized payload so history reads need no joins.
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    created_at = models.DateTimeField()
+    closed_at = models.DateTimeField(null=True)
+    sum_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=50, choices=Order.Status.choices)
+    order_items = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='archived_order_user_status_idx'),
+            models.Index(fields=['created_at'], name='archived_order_created_at_idx'),
+            models.Index(fields=['closed_at'], name='archived_order_closed_at_idx'),
+        ]
+
+    def __str__(self):
+        return self.user.username
+
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.date)
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='daily_product_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.product}'
+
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='daily_category_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.category}'
+
+
 def update_order_total(sender, instance, action, **kwargs):
     if action in ['post_add', 'post_remove', 'post_clear']:
         total_sum = sum(item.total for item in instance.order_items.all())
@@ -169,18 +430,3 @@ def update_order_total(sender, instance, action, **kwargs):
 
 
 m2m_changed.connect(update_order_total, sender=Order.order_items.through)
-
-local_storage = local()
-local_storage.deletion_in_progress = False
-
-@receiver(pre_delete, sender=OrderItemRelation)
-def delete_related_order_item(sender, instance, **kwargs):
-    # Avoid recursive calls by checking the thread-local flag
-    if not getattr(local_storage, "deletion_in_progress", False):
-        try:
-            local_storage.deletion_in_progress = True
-            if instance.order_item:
-                print(f"Deleting associated OrderItem ID: {instance.order_item.id}")
-                instance.order_item.delete()
-        finally:
-            local_storage.deletion_in_progress = False
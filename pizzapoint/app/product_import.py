@@ -0,0 +1,205 @@
+import csv
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .campaigns import refresh_prices
+from .catalogue import bump_catalogue_version
+from .changes import record_changes
+from .models import (Category,
+                     Product,
+                     calculate_new_price)
+
+
+TEXT_FIELDS = ['name_en',
+               'name_hu',
+               'description_en',
+               'description_hu',
+               'thumbnail',
+               'image']
+
+BOOLEAN_FIELDS = ['is_best',
+                  'is_active']
+
+REQUIRED_FIELDS = TEXT_FIELDS + ['price',
+                                 'discount',
+                                 'category']
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+class ProductImportError(Exception):
+    pass
+
+
+def check_rows(rows):
+    if not isinstance(rows, list):
+        raise ProductImportError('Expected a JSON list of objects.')
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ProductImportError(f'Row {number} is not an object.')
+    return rows
+
+
+def parse_rows(content, file_format):
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    if file_format == 'json':
+        try:
+            rows = json.loads(content)
+        except ValueError as error:
+            raise ProductImportError(f'Invalid JSON: {error}')
+        return check_rows(rows)
+
+    if file_format == 'csv':
+        return list(csv.DictReader(io.StringIO(content)))
+
+    raise ProductImportError(f'Unsupported format: {file_format}')
+
+
+def clean_row(row):
+    values = {}
+    errors = {}
+
+    for field, value in row.items():
+        if value is None or value == '' or field == 'id':
+            continue
+
+        if field in TEXT_FIELDS:
+            values[field] = str(value)
+
+        elif field == 'price':
+            try:
+                values['price'] = Decimal(str(value)).quantize(Decimal('0.01'))
+            except InvalidOperation:
+                errors['price'] = 'Not a number.'
+                continue
+            if values['price'] < 0:
+                errors['price'] = 'Must not be negative.'
+
+        elif field == 'discount':
+            try:
+                values['discount'] = int(value)
+            except (TypeError, ValueError):
+                errors['discount'] = 'Not an integer.'
+                continue
+            if not 0 <= values['discount'] <= 100:
+                errors['discount'] = 'Must be between 0 and 100.'
+
+        elif field in BOOLEAN_FIELDS:
+            if isinstance(value, bool):
+                values[field] = value
+            elif str(value).strip().lower() in TRUE_VALUES:
+                values[field] = True
+            elif str(value).strip().lower() in FALSE_VALUES:
+                values[field] = False
+            else:
+                errors[field] = 'Not a boolean.'
+
+        elif field == 'category':
+            try:
+                values['category_id'] = int(value)
+            except (TypeError, ValueError):
+                errors['category'] = 'Not a category id.'
+
+        else:
+            errors[field] = 'Unknown field.'
+
+    return values, errors
+
+
+def import_products(rows, dry_run=False, batch_size=500):
+    started = time.perf_counter()
+
+    ids = []
+    for row in rows:
+        try:
+            ids.append(int(row['id']))
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    existing = Product.objects.in_bulk(ids)
+    category_ids = set(Category.objects.values_list('pk', flat=True))
+
+    created = []
+    updated = []
+    changed_fields = set()
+    changes = []
+    errors = []
+
+    for number, row in enumerate(rows, start=1):
+        values, row_errors = clean_row(row)
+
+        if values.get('category_id') is not None and values['category_id'] not in category_ids:
+            row_errors['category'] = 'Category does not exist.'
+
+        product_id = row.get('id')
+        if product_id not in (None, ''):
+            try:
+                product = existing.get(int(product_id))
+            except (TypeError, ValueError):
+                product = None
+            if product is None:
+                row_errors['id'] = 'Product does not exist.'
+        else:
+            product = None
+            for field in REQUIRED_FIELDS:
+                key = 'category_id' if field == 'category' else field
+                if key not in values and field not in row_errors:
+                    row_errors[field] = 'This field is required.'
+
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+            continue
+
+        if product is None:
+            product = Product(**values)
+            product.new_price = calculate_new_price(product.price, product.discount)
+            created.append(product)
+            continue
+
+        diff = {}
+        for field, value in values.items():
+            old = getattr(product, field)
+            if old != value:
+                diff[field] = [old, value]
+                setattr(product, field, value)
+
+        if 'price' in diff or 'discount' in diff:
+            new_price = calculate_new_price(product.price, product.discount)
+            if new_price != product.new_price:
+                diff['new_price'] = [product.new_price, new_price]
+                product.new_price = new_price
+
+        if diff:
+            updated.append(product)
+            changed_fields.update(diff)
+            changes.append({'id': product.pk, 'changes': diff})
+
+    if not errors and not dry_run and (created or updated):
+        with transaction.atomic():
+            Product.objects.bulk_create(created, batch_size=batch_size)
+            if updated:
+                Product.objects.bulk_update(updated, sorted(changed_fields), batch_size=batch_size)
+            record_changes(Product, [product.pk for product in created + updated])
+            # Bulk writes skip the per-product signals, so materialize the
+            # effective prices with the products and bump the catalogue
+            # version once they are committed.
+            refresh_prices(bump=False)
+            transaction.on_commit(bump_catalogue_version)
+
+    return {
+        'dry_run': dry_run,
+        'applied': not errors and not dry_run,
+        'created': len(created),
+        'updated': len(updated),
+        'unchanged': len(rows) - len(created) - len(updated) - len(errors),
+        'changes': changes,
+        'errors': errors,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
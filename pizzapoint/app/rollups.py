@@ -0,0 +1,162 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (ArchivedOrder,
+                     Order,
+                     OrderItem,
+                     Product,
+                     DailySales,
+                     DailyProductSales,
+                     DailyCategorySales)
+from .signals import order_status_changed
+
+
+def _increment(model, lookup, revenue, quantity, orders):
+    changes = {'revenue': F('revenue') + revenue,
+               'quantity': F('quantity') + quantity,
+               'orders': F('orders') + orders}
+
+    if model.objects.filter(**lookup).update(**changes):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(revenue=revenue, quantity=quantity, orders=orders, **lookup)
+    except IntegrityError:
+        # Another worker created the row between our UPDATE and INSERT.
+        model.objects.filter(**lookup).update(**changes)
+
+
+def record_completed_order(order):
+    # Booked on the day the order closed; created_at is auto_now.
+    day = timezone.localdate(order.closed_at)
+    lines = (order.order_items
+             .exclude(product=None)
+             .values('product', 'product__category')
+             .annotate(revenue=Sum('total'), quantity=Sum('quantity')))
+
+    categories = defaultdict(lambda: [Decimal(0), 0])
+    revenue = Decimal(0)
+    quantity = 0
+
+    with transaction.atomic():
+        for line in lines:
+            _increment(DailyProductSales, {'date': day, 'product_id': line['product']},
+                       line['revenue'], line['quantity'], 1)
+            categories[line['product__category']][0] += line['revenue']
+            categories[line['product__category']][1] += line['quantity']
+            revenue += line['revenue']
+            quantity += line['quantity']
+
+        for category_id, (category_revenue, category_quantity) in categories.items():
+            _increment(DailyCategorySales, {'date': day, 'category_id': category_id},
+                       category_revenue, category_quantity, 1)
+
+        _increment(DailySales, {'date': day}, revenue, quantity, 1)
+
+
+@receiver(order_status_changed, sender=Order)
+def update_rollups(sender, instance, old_status, new_status, **kwargs):
+    if new_status == Order.Status.COMPLETED:
+        record_completed_order(instance)
+
+
+def archived_orders(since=None, until=None):
+    # Archived orders keep their lines as serialized payloads:
+    # yield (day, [(product id, revenue, quantity), ...]) per order.
+    orders = ArchivedOrder.objects.filter(status=Order.Status.COMPLETED)
+    if since:
+        orders = orders.filter(closed_at__date__gte=since)
+    if until:
+        orders = orders.filter(closed_at__date__lte=until)
+
+    for order in orders.iterator():
+        lines = [(line['product']['id'], Decimal(line['total']), line['quantity'])
+                 for line in order.order_items if line.get('product')]
+        yield timezone.localdate(order.closed_at), lines
+
+
+def backfill(since=None, until=None, batch_size=500):
+    items = OrderItem.objects.filter(order_items__status=Order.Status.COMPLETED).exclude(product=None)
+    rollups = [DailySales, DailyProductSales, DailyCategorySales]
+    if since:
+        items = items.filter(order_items__closed_at__date__gte=since)
+    if until:
+        items = items.filter(order_items__closed_at__date__lte=until)
+    items = items.annotate(day=TruncDate('order_items__closed_at'))
+
+    totals = {'revenue': Sum('total'),
+              'quantity': Sum('quantity'),
+              'orders': Count('order_items', distinct=True)}
+
+    # [revenue, quantity, orders] per day, (day, product) and (day, category).
+    daily = defaultdict(lambda: [Decimal(0), 0, 0])
+    products = defaultdict(lambda: [Decimal(0), 0, 0])
+    categories = defaultdict(lambda: [Decimal(0), 0, 0])
+
+    def add(rows, key, revenue, quantity, orders):
+        rows[key][0] += revenue
+        rows[key][1] += quantity
+        rows[key][2] += orders
+
+    for row in items.values('day').annotate(**totals):
+        add(daily, row['day'], row['revenue'], row['quantity'], row['orders'])
+    for row in items.values('day', 'product').annotate(**totals):
+        add(products, (row['day'], row['product']), row['revenue'], row['quantity'], row['orders'])
+    for row in items.values('day', 'product__category').annotate(**totals):
+        add(categories, (row['day'], row['product__category']), row['revenue'], row['quantity'], row['orders'])
+
+    # Archived orders left the hot tables but still count. Their products
+    # are attributed to the product's current category, as above.
+    archived = list(archived_orders(since, until))
+    product_ids = {product_id for _, lines in archived for product_id, _, _ in lines}
+    category_of = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'category_id'))
+
+    for day, lines in archived:
+        order_products = defaultdict(lambda: [Decimal(0), 0])
+        order_categories = defaultdict(lambda: [Decimal(0), 0])
+        for product_id, revenue, quantity in lines:
+            if product_id in category_of:
+                order_products[product_id][0] += revenue
+                order_products[product_id][1] += quantity
+                order_categories[category_of[product_id]][0] += revenue
+                order_categories[category_of[product_id]][1] += quantity
+
+        if not order_products:
+            continue
+
+        add(daily, day, sum(revenue for revenue, _ in order_products.values()),
+            sum(quantity for _, quantity in order_products.values()), 1)
+        for product_id, (revenue, quantity) in order_products.items():
+            add(products, (day, product_id), revenue, quantity, 1)
+        for category_id, (revenue, quantity) in order_categories.items():
+            add(categories, (day, category_id), revenue, quantity, 1)
+
+    with transaction.atomic():
+        for model in rollups:
+            existing = model.objects.all()
+            if since:
+                existing = existing.filter(date__gte=since)
+            if until:
+                existing = existing.filter(date__lte=until)
+            existing.delete()
+
+        DailySales.objects.bulk_create([DailySales(date=day, revenue=revenue, quantity=quantity, orders=orders)
+                                        for day, (revenue, quantity, orders) in daily.items()],
+                                       batch_size=batch_size)
+        DailyProductSales.objects.bulk_create([DailyProductSales(date=day, product_id=product_id, revenue=revenue,
+                                                                 quantity=quantity, orders=orders)
+                                               for (day, product_id), (revenue, quantity, orders) in products.items()],
+                                              batch_size=batch_size)
+        DailyCategorySales.objects.bulk_create([DailyCategorySales(date=day, category_id=category_id, revenue=revenue,
+                                                                   quantity=quantity, orders=orders)
+                                                for (day, category_id), (revenue, quantity, orders) in categories.items()],
+                                               batch_size=batch_size)
+
+    return {'days': len(daily), 'products': len(products), 'categories': len(categories)}
@@ -0,0 +1,87 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import (Order,
+                     OrderItem)
+
+
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+CATALOGUE_PIN = 'catalogue'
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def pin_key(name):
+    return f'replica:pinned:{name}'
+
+
+def pin(name):
+    # For REPLICA_PIN_SECONDS after a write, reads that could see it go
+    # to the primary, so a lagging replica never hides it.
+    cache.set(pin_key(name), True, REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    names = [CATALOGUE_PIN]
+    if user is not None and user.is_authenticated:
+        names.append(user.pk)
+    return bool(cache.get_many([pin_key(name) for name in names]))
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if read_from_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and are never migrated directly.
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+
+    # Safe requests to these viewsets read from a replica unless the
+    # user (or the catalogue) was written to in the last few seconds.
+    def dispatch(self, request, *args, **kwargs):
+        # Reset in finally: DRF skips finalize_response when a view raises,
+        # and a leaked flag would send every later request on this thread
+        # to the replica.
+        self.replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.replica_token is not None:
+                read_from_replica.reset(self.replica_token)
+                self.replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and replica_aliases() and not is_pinned(request.user):
+            self.replica_token = read_from_replica.set(True)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=OrderItem)
+def pin_user(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        pin(instance.user_id)
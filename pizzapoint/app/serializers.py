@@ -1,14 +1,53 @@
 from rest_framework import serializers
 
+from .languages import LANGUAGES
 from .models import (User,
                      Banner,
                      Category,
                      Product,
                      OrderItem,
-                     Order)
+                     Order,
+                     ArchivedOrder,
+                     DailySales,
+                     DailyProductSales,
+                     DailyCategorySales)
 
 
-class CatalogueSerializer(serializers.ModelSerializer):
+class LanguageFieldsMixin:
+
+    # Drops the *_en / *_hu fields of every language except context['lang'].
+    # Nested serializers read the root's context, so one setting covers
+    # a whole menu payload.
+    def get_fields(self):
+        fields = super().get_fields()
+        lang = self.context.get('lang')
+
+        if lang:
+            for name in list(fields):
+                suffix = name.rsplit('_', 1)[-1]
+                if '_' in name and suffix in LANGUAGES and suffix != lang:
+                    del fields[name]
+
+        return fields
+
+
+class SparseFieldsMixin:
+
+    # Keeps only context['fields'] (plus id) when the client asked for a
+    # sparse fieldset; the view defers the matching columns with .only().
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+
+        if requested:
+            for name in list(fields):
+                if name not in requested and name != 'id':
+                    del fields[name]
+
+        return fields
+
+
+class CatalogueSerializer(LanguageFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id',
@@ -16,7 +55,7 @@ class CatalogueSerializer(serializers.ModelSerializer):
                   'name_hu']
 
 
-class BannerSerializer(serializers.ModelSerializer):
+class BannerSerializer(LanguageFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Banner
         fields = ['image',
@@ -24,7 +63,11 @@ class BannerSerializer(serializers.ModelSerializer):
                   'name_hu']
 
 
-class ProductItemSerializer(serializers.ModelSerializer):
+class ProductItemSerializer(SparseFieldsMixin, LanguageFieldsMixin, serializers.ModelSerializer):
+
+    discount = serializers.IntegerField(source='current_discount', read_only=True)
+    new_price = serializers.DecimalField(max_digits=10, decimal_places=2, source='current_price', read_only=True)
+
     class Meta:
         model = Product
         fields = ['id',
@@ -49,7 +92,7 @@ class UserSerializer(serializers.ModelSerializer):
                   'phone_number']
 
 
-class CatalogueWithImageSerializer(serializers.ModelSerializer):
+class CatalogueWithImageSerializer(LanguageFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id',
@@ -58,7 +101,10 @@ class CatalogueWithImageSerializer(serializers.ModelSerializer):
                   'image']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, LanguageFieldsMixin, serializers.ModelSerializer):
+
+    discount = serializers.IntegerField(source='current_discount', read_only=True)
+    new_price = serializers.DecimalField(max_digits=10, decimal_places=2, source='current_price', read_only=True)
 
     class Meta:
         model = Product
@@ -81,7 +127,7 @@ class ProductSerializer(serializers.ModelSerializer):
         return super().to_representation(instance)
 
 
-class MenuSerializer(serializers.ModelSerializer):
+class MenuSerializer(LanguageFieldsMixin, serializers.ModelSerializer):
 
     products = ProductItemSerializer(many=True, read_only=True)
 
@@ -93,7 +139,7 @@ class MenuSerializer(serializers.ModelSerializer):
                   'products']
 
 
-class MenuWithoutIdSerializer(serializers.ModelSerializer):
+class MenuWithoutIdSerializer(LanguageFieldsMixin, serializers.ModelSerializer):
 
     products = ProductItemSerializer(many=True, read_only=True)
 
@@ -105,9 +151,27 @@ class MenuWithoutIdSerializer(serializers.ModelSerializer):
                   'products']
 
 
+class OrderLineProductSerializer(serializers.Serializer):
+
+    id = serializers.IntegerField(source='product_id')
+    name_en = serializers.CharField(source='product_name_en')
+    name_hu = serializers.CharField(source='product_name_hu')
+    thumbnail = serializers.SerializerMethodField()
+    is_best = serializers.BooleanField(source='product_is_best')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, source='product_price')
+    discount = serializers.IntegerField(source='product_discount')
+    new_price = serializers.DecimalField(max_digits=10, decimal_places=2, source='unit_price')
+
+    def get_thumbnail(self, instance):
+        if not instance.product_thumbnail:
+            return None
+        return Product._meta.get_field('thumbnail').storage.url(instance.product_thumbnail)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
 
-    product = ProductItemSerializer(read_only=True)
+    # Rendered from the line's snapshot: no join to Product.
+    product = OrderLineProductSerializer(source='*', read_only=True)
 
     class Meta:
         model = OrderItem
@@ -123,6 +187,9 @@ class CreateOrderItemSerializer(serializers.ModelSerializer):
         fields = ['user',
                   'quantity',
                   'product',]
+        # The column is nullable for lines whose product was deleted, but
+        # a new line needs one.
+        extra_kwargs = {'product': {'allow_null': False, 'required': True}}
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -152,3 +219,92 @@ class OrderStatusSerializer(serializers.ModelSerializer):
         
         # Proceed with updating the order instance
         return super().update(instance, validated_data)
+
+
+class SyncBannerSerializer(LanguageFieldsMixin, serializers.ModelSerializer):
+
+    class Meta:
+        model = Banner
+        fields = ['id',
+                  'name_en',
+                  'name_hu',
+                  'image',
+                  'queue']
+
+
+class SyncCategorySerializer(LanguageFieldsMixin, serializers.ModelSerializer):
+
+    class Meta:
+        model = Category
+        fields = ['id',
+                  'name_en',
+                  'name_hu',
+                  'image',
+                  'queue']
+
+
+class SyncProductSerializer(LanguageFieldsMixin, serializers.ModelSerializer):
+
+    discount = serializers.IntegerField(source='current_discount', read_only=True)
+    new_price = serializers.DecimalField(max_digits=10, decimal_places=2, source='current_price', read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id',
+                  'category',
+                  'name_en',
+                  'name_hu',
+                  'thumbnail',
+                  'is_best',
+                  'price',
+                  'discount',
+                  'new_price']
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'sum_total', 'status', 'order_items']
+
+
+class DailySalesSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = DailySales
+        fields = ['date',
+                  'revenue',
+                  'quantity',
+                  'orders']
+
+
+class DailyProductSalesSerializer(serializers.ModelSerializer):
+
+    name_en = serializers.CharField(source='product.name_en', read_only=True)
+    name_hu = serializers.CharField(source='product.name_hu', read_only=True)
+
+    class Meta:
+        model = DailyProductSales
+        fields = ['date',
+                  'product',
+                  'name_en',
+                  'name_hu',
+                  'revenue',
+                  'quantity',
+                  'orders']
+
+
+class DailyCategorySalesSerializer(serializers.ModelSerializer):
+
+    name_en = serializers.CharField(source='category.name_en', read_only=True)
+    name_hu = serializers.CharField(source='category.name_hu', read_only=True)
+
+    class Meta:
+        model = DailyCategorySales
+        fields = ['date',
+                  'category',
+                  'name_en',
+                  'name_hu',
+                  'revenue',
+                  'quantity',
+                  'orders']
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent by Order.save whenever an order is created or its status changes.
+# Receivers get ``instance``, ``old_status`` (None on creation) and ``new_status``.
+order_status_changed = Signal()
@@ -0,0 +1,80 @@
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+
+# Entries are fresh for SINGLEFLIGHT_TTL seconds and may then be served
+# stale for SINGLEFLIGHT_STALE_TTL more while one request rebuilds them.
+# A rebuild claim lives for at most SINGLEFLIGHT_LOCK_TTL seconds, and a
+# request with nothing to serve waits up to SINGLEFLIGHT_WAIT for it.
+# Builds that find nothing (None) are remembered for
+# SINGLEFLIGHT_NEGATIVE_TTL seconds, so a herd on a dead link is
+# coalesced like any other.
+SINGLEFLIGHT_TTL = getattr(settings, 'SINGLEFLIGHT_TTL', 60 * 5)
+SINGLEFLIGHT_STALE_TTL = getattr(settings, 'SINGLEFLIGHT_STALE_TTL', 60 * 60)
+SINGLEFLIGHT_NEGATIVE_TTL = getattr(settings, 'SINGLEFLIGHT_NEGATIVE_TTL', 30)
+SINGLEFLIGHT_LOCK_TTL = getattr(settings, 'SINGLEFLIGHT_LOCK_TTL', 10)
+SINGLEFLIGHT_WAIT = getattr(settings, 'SINGLEFLIGHT_WAIT', 2)
+SINGLEFLIGHT_BETA = getattr(settings, 'SINGLEFLIGHT_BETA', 1.0)
+SINGLEFLIGHT_POLL = 0.01
+
+
+def is_due(entry, version, now):
+    if entry['version'] != version:
+        return True
+    # Probabilistic early refresh (XFetch): the closer the expiry and the
+    # slower the last build, the likelier a request rebuilds ahead of time.
+    return now - entry['delta'] * SINGLEFLIGHT_BETA * math.log(1 - random.random()) >= entry['expires']
+
+
+def store(key, version, build):
+    started = time.time()
+    data = build()
+    now = time.time()
+    if data is None:
+        ttl, timeout = SINGLEFLIGHT_NEGATIVE_TTL, SINGLEFLIGHT_NEGATIVE_TTL
+    else:
+        ttl, timeout = SINGLEFLIGHT_TTL, SINGLEFLIGHT_TTL + SINGLEFLIGHT_STALE_TTL
+    cache.set(key, {'version': version,
+                    'data': data,
+                    'delta': now - started,
+                    'expires': now + ttl}, timeout)
+    return data
+
+
+def get_or_build(key, version, build, name='singleflight'):
+    entry = cache.get(key)
+
+    if entry is not None and not is_due(entry, version, time.time()):
+        metrics.inc('cache_requests_total', cache=name, result='hit')
+        return entry['data']
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, SINGLEFLIGHT_LOCK_TTL):
+        metrics.inc('cache_requests_total', cache=name, result='miss' if entry is None else 'refresh')
+        try:
+            return store(key, version, build)
+        finally:
+            cache.delete(lock_key)
+
+    # Someone else is rebuilding: serve what we have, even if stale...
+    if entry is not None:
+        metrics.inc('cache_requests_total', cache=name, result='stale')
+        return entry['data']
+
+    # ...or wait for their result rather than hitting the database too.
+    deadline = time.monotonic() + SINGLEFLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(SINGLEFLIGHT_POLL)
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            metrics.inc('cache_requests_total', cache=name, result='coalesced')
+            return entry['data']
+
+    metrics.inc('cache_requests_total', cache=name, result='miss')
+    return store(key, version, build)
@@ -1,3 +1,1162 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from . import cart, idempotency, log, metrics, singleflight, verification
+from .archive import archive_orders
+from .campaigns import refresh_prices
+from .catalogue import catalogue_version
+from .deletion import delete_order_items, delete_orders
+from .exports import EXPORT_FIELDS, export_rows
+from .fieldsets import COMPACT_PRODUCT_FIELDS, requested_fields
+from .languages import parse_accept_language
+from .middleware import BrowserOnlyMiddleware
+from .product_import import ProductImportError, import_products, parse_rows
+from .rollups import backfill
+from .routers import read_from_replica
+from .views import NewDiscountProductPagination
+from .warmup import WARMUP_STEPS, warm_up
+from .models import (User,
+                     ArchivedOrder,
+                     Banner,
+                     Campaign,
+                     DailySales,
+                     DailyProductSales,
+                     DailyCategorySales,
+                     Category,
+                     Product,
+                     ProductPrice,
+                     OrderItem,
+                     OrderItemRelation,
+                     Order)
+
+
+def create_product(category, **fields):
+    return Product.objects.create(**{'name_en': 'Margherita',
+                                     'name_hu': 'Margherita',
+                                     'description_en': 'Tomato',
+                                     'description_hu': 'Paradicsom',
+                                     'price': 10,
+                                     'discount': 0,
+                                     'thumbnail': 'thumbnail.jpg',
+                                     'image': 'image.jpg',
+                                     'category': category,
+                                     **fields})
+
+
+class CatalogueTestCase(TestCase):
+
+    # A customer and one product in one category, shared by most tests.
+    product_fields = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='customer', phone_number='+36000000000')
+        cls.category = Category.objects.create(name_en='Pizza', name_hu='Pizza', queue=1)
+        cls.product = create_product(cls.category, **cls.product_fields)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class QueryPlanTest(CatalogueTestCase):
+
+    product_fields = {'discount': 10, 'is_best': True}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Banner.objects.create(name_en='Banner', name_hu='Banner', image='banner.jpg', queue=1)
+        cls.order_item = OrderItem.objects.create(user=cls.user, product=cls.product, quantity=1)
+        cls.order = Order.objects.create(user=cls.user)
+        cls.pending_item = OrderItem.objects.create(user=cls.user, product=cls.product, quantity=2)
+
+    # Listings that read every row of an index on purpose: all categories
+    # and banners in queue order, and the best products, whose partial
+    # index holds nothing else. Any other scan fails the test.
+    ALLOWED_SCANS = {'SCAN app_category USING INDEX category_queue_idx',
+                     'SCAN app_banner USING INDEX banner_queue_idx',
+                     'SCAN app_product USING INDEX product_best_idx'}
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        return [step for step in plan if step.startswith('SCAN ')]
+
+    def assertNoFullScans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            for scan in self.full_scans(query['sql']):
+                self.assertIn(scan, self.ALLOWED_SCANS, f'{url}: {query["sql"]}')
+
+    def test_catalogue_queries_use_indexes(self):
+        for url in ['/api/catalogue_in_header/',
+                    '/api/banner/',
+                    '/api/new_product/',
+                    '/api/discount_product/',
+                    '/api/home/',
+                    '/api/menu/',
+                    '/api/catalogue/',
+                    '/api/catalogue/changes/?since=0',
+                    f'/api/catalogue/{self.category.pk}/menu/',
+                    f'/api/products/{self.product.pk}/product/']:
+            self.assertNoFullScans(url)
+
+    def test_order_queries_use_indexes(self):
+        for url in ['/api/user/',
+                    '/api/order_items/',
+                    f'/api/order_items/{self.pending_item.pk}/order_item/',
+                    '/api/orders/',
+                    '/api/active_orders/',
+                    f'/api/active_orders/{self.order.pk}/order/',
+                    '/api/completed_orders/']:
+            self.assertNoFullScans(url)
+
+
+class ReplicaReadTest(TestCase):
+
+    def test_failed_request_does_not_leave_replica_reads_on(self):
+        client = APIClient(raise_request_exception=False)
+        with mock.patch('app.routers.replica_aliases', return_value=['default']):
+            self.assertEqual(client.get('/api/products/999999/product/').status_code, 404)
+            self.assertFalse(read_from_replica.get())
+
+            with mock.patch('app.views.product_payload', side_effect=RuntimeError), self.assertLogs('django.request', 'ERROR'):
+                self.assertEqual(client.get('/api/products/999999/product/').status_code, 500)
+            self.assertFalse(read_from_replica.get())
+
+
+class RefreshPricesTest(CatalogueTestCase):
+
+    product_fields = {'discount': 10}
+
+    def price_writes(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return [query['sql'].split()[0] for query in queries
+                if 'app_productprice' in query['sql'] and not query['sql'].startswith('SELECT')]
+
+    def test_unchanged_prices_keep_the_catalogue_version(self):
+        version = catalogue_version()
+        refresh_prices()
+        refresh_prices()
+        self.assertEqual(catalogue_version(), version)
+
+    def test_changed_prices_bump_the_catalogue_version(self):
+        now = timezone.now()
+        campaign = Campaign.objects.create(name='Half price', percent=50, starts_at=now - timedelta(hours=1), ends_at=now + timedelta(hours=1))
+        campaign.products.add(self.product)
+
+        version = catalogue_version()
+        refresh_prices(now)
+        self.assertEqual(catalogue_version(), version + 1)
+        self.assertEqual(ProductPrice.objects.get(product=self.product).discount, 50)
+
+    def test_unchanged_prices_are_not_rewritten(self):
+        self.assertEqual(self.price_writes(refresh_prices), [])
+
+    def test_only_changed_prices_are_written(self):
+        other = create_product(self.category, name_en='Diavola', discount=20)
+        now = timezone.now()
+        campaign = Campaign.objects.create(name='Half price', percent=50, starts_at=now - timedelta(hours=1), ends_at=now + timedelta(hours=1))
+        campaign.products.add(self.product)
+
+        self.assertEqual(self.price_writes(lambda: refresh_prices(now)), ['UPDATE'])
+        self.assertEqual(ProductPrice.objects.get(product=other).discount, 20)
+
+        campaign.products.remove(self.product)
+        Product.objects.filter(pk=other.pk).update(discount=0)
+        self.assertEqual(self.price_writes(lambda: refresh_prices(now)), ['DELETE', 'UPDATE'])
+        self.assertEqual(list(ProductPrice.objects.values_list('product', 'discount')), [(self.product.pk, 10)])
+
+    def test_saving_a_product_bumps_the_version_once(self):
+        version = catalogue_version()
+
+        self.product.discount = 20
+        self.product.save()
+
+        self.assertEqual(catalogue_version(), version + 1)
+        self.assertEqual(ProductPrice.objects.get(product=self.product).discount, 20)
+
+
+class ArchiveTest(CatalogueTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        OrderItem.objects.create(user=cls.user, product=cls.product, quantity=2)
+        OrderItem.objects.create(user=cls.user, product=cls.product, quantity=1)
+        order = Order.objects.create(user=cls.user)
+        order.status = Order.Status.COMPLETED
+        order.save()
+        Order.objects.filter(pk=order.pk).update(closed_at=timezone.now() - timedelta(days=40))
+        cls.order = order
+
+    def rollups(self):
+        return [list(model.objects.order_by('pk').values_list('date', 'revenue', 'quantity', 'orders'))
+                for model in [DailySales, DailyProductSales, DailyCategorySales]]
+
+    def test_archived_orders_stay_in_exports(self):
+        before = list(export_rows())
+        self.assertEqual(len(before), 2)
+
+        self.assertEqual(archive_orders(days=30), 1)
+
+        self.assertEqual(list(export_rows()), before)
+
+    def test_closing_an_order_records_closed_at(self):
+        self.assertIsNotNone(self.order.closed_at)
+
+        OrderItem.objects.create(user=self.user, product=self.product, quantity=1)
+        self.assertIsNone(Order.objects.create(user=self.user).closed_at)
+
+    def test_touching_an_old_order_does_not_keep_it_hot(self):
+        closed_at = Order.objects.get(pk=self.order.pk).closed_at
+        Order.objects.filter(pk=self.order.pk).update(created_at=timezone.now())
+
+        self.assertEqual(archive_orders(days=30), 1)
+        self.assertEqual(ArchivedOrder.objects.get().closed_at, closed_at)
+
+    def test_recently_closed_orders_stay_hot(self):
+        Order.objects.filter(pk=self.order.pk).update(closed_at=timezone.now(),
+                                                      created_at=timezone.now() - timedelta(days=40))
+
+        self.assertEqual(archive_orders(days=30), 0)
+
+    def test_rollups_book_the_day_the_order_closed(self):
+        closed_on = timezone.localdate(Order.objects.get(pk=self.order.pk).closed_at)
+        Order.objects.filter(pk=self.order.pk).update(created_at=timezone.now())
+
+        backfill()
+
+        self.assertEqual(list(DailySales.objects.values_list('date', flat=True)), [closed_on])
+
+    def test_archived_orders_stay_in_rollups(self):
+        backfill()
+        before = self.rollups()
+        self.assertEqual(before[0][0][1:], (30, 3, 1))
+
+        archive_orders(days=30)
+        backfill()
+
+        self.assertEqual(self.rollups(), before)
+
+
+class CartTest(CatalogueTestCase):
+
+    def add(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/order_items/', {'product': self.product.pk, 'quantity': quantity})
+        self.assertEqual(response.status_code, 201)
+
+    def quantities(self):
+        return sorted(line['quantity'] for line in self.client.get('/api/order_items/').data['order_items'])
+
+    def test_writes_show_up_in_a_cached_cart(self):
+        self.add(1)
+        self.assertEqual(self.quantities(), [1])
+        self.add(2)
+        self.assertEqual(self.quantities(), [1, 2])
+
+        line = OrderItem.objects.get(user=self.user, quantity=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/order_items/{line.pk}/order_item/', {'quantity': 3})
+        self.assertEqual(self.quantities(), [1, 3])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/order_items/{line.pk}/order_item/')
+        self.assertEqual(self.quantities(), [1])
+        self.assertEqual(self.client.get('/api/order_items/').data['total'], '10.00')
+
+    def test_a_line_needs_a_product(self):
+        for data in [{'product': '', 'quantity': 1}, {'quantity': 1}]:
+            response = self.client.post('/api/order_items/', data)
+
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn('product', response.data)
+
+    def test_reads_after_writes_are_cache_hits(self):
+        self.add(1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.quantities(), [1])
+
+        line = OrderItem.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/order_items/{line.pk}/order_item/', {'quantity': 3})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.quantities(), [3])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.quantities(), [])
+
+    def test_a_cart_built_before_a_write_is_not_served_after_it(self):
+        self.add(1)
+        key = cart.cart_key(self.user.pk)
+        stale = cart.build_cart(self.user.pk)
+
+        self.add(2)
+        cache.set(key, stale)
+
+        self.assertEqual(self.quantities(), [1, 2])
+
+
+class VerificationTest(TestCase):
+
+    phone_number = '+36000000001'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.codes = []
+        patcher = mock.patch('app.verification.send_sms', side_effect=lambda phone_number, body: self.codes.append(body.split()[-1]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = self.client.post('/api/user/register/', {'phone_number': self.phone_number, 'username': 'customer'})
+        self.assertEqual(response.status_code, 201)
+
+    def verify(self, code):
+        return self.client.post('/api/user/verify/', {'phone_number': self.phone_number, 'code': code})
+
+    def resend(self):
+        return self.client.post('/api/user/resend/', {'phone_number': self.phone_number})
+
+    def wrong(self, code):
+        return '0' * len(code) if code != '0' * len(code) else '1' * len(code)
+
+    def test_correct_code_verifies_once(self):
+        response = self.verify(self.wrong(self.codes[-1]))
+        self.assertEqual(response.data['message'], 'Invalid verification code')
+
+        response = self.verify(self.codes[-1])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', response.data)
+        self.assertTrue(User.objects.get(phone_number=self.phone_number).is_phone_verified)
+
+        self.assertEqual(self.verify(self.codes[-1]).data['message'], 'Verification code expired')
+
+    def test_expired_code_can_be_replaced(self):
+        with mock.patch('app.verification.time.time', return_value=time.time() + verification.CODE_TTL + 1):
+            response = self.verify(self.codes[-1])
+        self.assertEqual(response.data['message'], 'Verification code expired')
+
+        self.assertEqual(self.resend().status_code, 429)
+        cache.delete(verification.resend_key(self.phone_number))
+        self.assertEqual(self.resend().status_code, 200)
+
+        self.assertEqual(self.verify(self.codes[-1]).status_code, 200)
+
+    def test_lockout_after_too_many_attempts(self):
+        code = self.codes[-1]
+        for _ in range(verification.MAX_ATTEMPTS):
+            self.assertEqual(self.verify(self.wrong(code)).status_code, 400)
+        self.assertEqual(self.verify(code).status_code, 429)
+
+        cache.delete(verification.resend_key(self.phone_number))
+        self.assertEqual(self.resend().status_code, 200)
+        self.assertEqual(self.verify(self.codes[-1]).status_code, 200)
+
+    def test_resends_are_capped(self):
+        for _ in range(verification.MAX_SENDS - 1):
+            cache.delete(verification.resend_key(self.phone_number))
+            self.assertEqual(self.resend().status_code, 200)
+
+        cache.delete(verification.resend_key(self.phone_number))
+        self.assertEqual(self.resend().status_code, 429)
+        self.assertEqual(len(self.codes), verification.MAX_SENDS)
+
+
+class IdempotencyTest(CatalogueTestCase):
+
+    def add(self, quantity, key='key-1'):
+        return self.client.post('/api/order_items/', {'product': self.product.pk, 'quantity': quantity},
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def request(self, quantity):
+        return SimpleNamespace(headers={'Idempotency-Key': 'key-1'},
+                               method='POST',
+                               path='/api/order_items/',
+                               data={'quantity': quantity},
+                               user=self.user)
+
+    def test_retry_is_replayed(self):
+        first = self.add(1)
+        second = self.add(1)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(OrderItem.objects.filter(user=self.user).count(), 1)
+
+    def test_reused_key_with_another_body_is_rejected(self):
+        self.add(1)
+        response = self.add(2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(OrderItem.objects.filter(user=self.user).count(), 1)
+
+    def test_different_keys_are_separate_requests(self):
+        self.add(1, 'key-1')
+        self.add(1, 'key-2')
+        self.assertEqual(OrderItem.objects.filter(user=self.user).count(), 2)
+
+    def test_concurrent_duplicates_run_once(self):
+        calls = []
+        barrier = threading.Barrier(5)
+
+        @idempotency.idempotent
+        def view(self, request):
+            calls.append(1)
+            time.sleep(0.1)
+            return Response({'created': len(calls)}, status=201)
+
+        def send():
+            barrier.wait()
+            return view(None, self.request(1))
+
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(send())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([response.data for response in responses], [{'created': 1}] * 5)
+        self.assertEqual(sum(response.has_header('Idempotent-Replayed') for response in responses), 4)
+
+    def test_duplicate_of_a_slow_request_gets_409(self):
+        request = self.request(1)
+        key = idempotency.cache_key(request, 'key-1')
+        cache.add(key, {'state': idempotency.IN_PROGRESS, 'fingerprint': idempotency.fingerprint(request)}, 30)
+
+        with mock.patch('app.idempotency.IDEMPOTENCY_WAIT', 0.1):
+            response = idempotency.idempotent(lambda self, request: Response(status=201))(None, request)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_duplicate_with_another_body_while_in_progress_gets_422(self):
+        key = idempotency.cache_key(self.request(1), 'key-1')
+        cache.add(key, {'state': idempotency.IN_PROGRESS, 'fingerprint': idempotency.fingerprint(self.request(1))}, 30)
+
+        response = idempotency.idempotent(lambda self, request: Response(status=201))(None, self.request(2))
+
+        self.assertEqual(response.status_code, 422)
+
+
+class ConcurrencyTest(CatalogueTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.item = OrderItem.objects.create(user=cls.user, product=cls.product, quantity=1)
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/order_items/{self.item.pk}/order_item/'
+
+    def patch(self, quantity, **headers):
+        return self.client.patch(self.url, {'quantity': quantity}, **headers)
+
+    def test_matching_version_updates_and_returns_the_new_etag(self):
+        current = self.client.get(self.url)['ETag']
+
+        response = self.patch(2, HTTP_IF_MATCH=current)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], current)
+        self.assertEqual(self.client.get(self.url)['ETag'], response['ETag'])
+
+    def test_stale_version_conflicts(self):
+        stale = self.client.get(self.url)['ETag']
+        self.patch(2, HTTP_IF_MATCH=stale)
+
+        self.assertEqual(self.patch(3, HTTP_IF_MATCH=stale).status_code, 409)
+        self.assertEqual(OrderItem.objects.get(pk=self.item.pk).quantity, 2)
+
+    def test_version_zero_and_garbage_conflict(self):
+        for value in ['"0"', 'W/"0"', '"abc"']:
+            self.assertEqual(self.patch(2, HTTP_IF_MATCH=value).status_code, 409, value)
+        self.assertEqual(OrderItem.objects.get(pk=self.item.pk).quantity, 1)
+
+    def test_missing_or_wildcard_if_match_updates(self):
+        self.assertEqual(self.patch(2).status_code, 200)
+        self.assertEqual(self.patch(3, HTTP_IF_MATCH='*').status_code, 200)
+        self.assertEqual(OrderItem.objects.get(pk=self.item.pk).quantity, 3)
+
+    def test_stale_order_status_update_conflicts(self):
+        order = Order.objects.create(user=self.user)
+        url = f'/api/active_orders/{order.pk}/order/'
+        stale = self.client.get(url)['ETag']
+        Order.objects.filter(pk=order.pk).update(version=F('version') + 1)
+
+        response = self.client.patch(url, {'status': Order.Status.CANCELED}, HTTP_IF_MATCH=stale)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.ACTIVE)
+
+    def test_finished_or_unknown_order_is_404(self):
+        order = Order.objects.create(user=self.user)
+        url = f'/api/active_orders/{order.pk}/order/'
+
+        self.assertEqual(self.client.patch(url, {'status': Order.Status.COMPLETED}).status_code, 200)
+        self.assertEqual(self.client.patch(url, {'status': Order.Status.CANCELED}).status_code, 404)
+        self.assertEqual(self.client.get('/api/active_orders/999999/order/').status_code, 404)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.COMPLETED)
+
+    def test_rejected_status_change_is_400(self):
+        order = Order.objects.create(user=self.user)
+
+        with mock.patch.object(Order, 'full_clean', side_effect=ValidationError('Nope.')):
+            response = self.client.patch(f'/api/active_orders/{order.pk}/order/', {'status': Order.Status.CANCELED})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Nope.'})
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.Status.ACTIVE)
+
+
+class MetricsAccessTest(TestCase):
+
+    def test_direct_local_request_is_answered(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_total', response.content)
+
+    def test_proxied_request_is_refused(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_X_REAL_IP='203.0.113.7').status_code, 404)
+
+    def test_token_is_required_when_configured(self):
+        with mock.patch('app.metrics.METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret', HTTP_X_FORWARDED_FOR='203.0.113.7')
+            self.assertEqual(response.status_code, 200)
+
+
+class MetricsSnapshotTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = mock.patch('app.metrics.METRICS_DIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, worker, value):
+        metrics.write_json(os.path.join(self.directory, f'{worker}.json'),
+                           {'counters': {'orders_created_total': {'[]': value}}, 'histograms': {}})
+
+    def test_snapshots_are_keyed_by_pid_and_start_time(self):
+        if metrics.process_start(os.getpid()) is None:
+            self.skipTest('no /proc')
+
+        worker = metrics.worker_id(os.getpid())
+
+        self.assertRegex(worker, rf'^{os.getpid()}-\d+$')
+        self.assertTrue(metrics.is_running(worker))
+        self.assertFalse(metrics.is_running(f'{os.getpid()}-0'))
+
+    @mock.patch('app.metrics.fcntl', None)
+    def test_prune_needs_flock(self):
+        self.write(f'{os.getpid()}-0', 1)
+
+        self.assertEqual(metrics.prune(), 0)
+
+    def test_prune_retires_files_of_previous_processes(self):
+        if metrics.fcntl is None or metrics.process_start(os.getpid()) is None:
+            self.skipTest('no flock or /proc')
+
+        live = metrics.worker_id(os.getpid())
+        self.write(live, 1)
+        # Same PID, different process: the PID was reused.
+        self.write(f'{os.getpid()}-0', 2)
+        # Written before snapshots carried a start time.
+        self.write(os.getpid(), 4)
+
+        self.assertEqual(metrics.prune(), 2)
+
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.endswith('.json')),
+                         sorted([metrics.RETIRED, f'{live}.json']))
+        self.assertEqual(metrics.read_all()['counters']['orders_created_total']['[]'], 7)
+
+
+class DeletionTest(CatalogueTestCase):
+
+    def order(self, lines=2):
+        for _ in range(lines):
+            OrderItem.objects.create(user=self.user, product=self.product, quantity=1)
+        return Order.objects.create(user=self.user)
+
+    def test_deleting_an_order_deletes_its_items(self):
+        kept = self.order()
+        self.order().delete()
+
+        self.assertEqual(list(OrderItem.objects.values_list('order_items', flat=True)), [kept.pk, kept.pk])
+
+    def test_deleting_orders_in_bulk_deletes_their_items(self):
+        kept = self.order()
+        first, second = self.order(), self.order()
+
+        self.assertEqual(delete_orders([first.pk, second.pk]), 2)
+        Order.objects.filter(pk=kept.pk).delete()
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(OrderItemRelation.objects.exists())
+
+    def test_deleting_a_relation_deletes_its_item(self):
+        order = self.order()
+        relation = OrderItemRelation.objects.filter(order=order).first()
+
+        relation.delete()
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+        OrderItemRelation.objects.filter(order=order).delete()
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_deleting_cart_lines_updates_the_cart(self):
+        line = OrderItem.objects.create(user=self.user, product=self.product, quantity=1)
+        self.assertEqual(len(cart.get_cart(self.user.pk)['order_items']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(delete_order_items([line.pk]), 1)
+
+        self.assertEqual(cart.get_cart(self.user.pk)['order_items'], [])
+
+    def test_cleanup_carts_only_deletes_old_pending_lines(self):
+        ordered = self.order(lines=1)
+        Order.objects.filter(pk=ordered.pk).update(created_at=timezone.now() - timedelta(days=60))
+        OrderItem.objects.update(created_at=timezone.now() - timedelta(days=60))
+        old = OrderItem.objects.create(user=self.user, product=self.product, quantity=1)
+        OrderItem.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=60))
+        recent = OrderItem.objects.create(user=self.user, product=self.product, quantity=1)
+
+        call_command('cleanup_carts', days=30, stdout=StringIO())
+
+        remaining = set(OrderItem.objects.values_list('pk', flat=True))
+        self.assertNotIn(old.pk, remaining)
+        self.assertIn(recent.pk, remaining)
+        self.assertEqual(OrderItem.objects.filter(order_items=ordered).count(), 1)
+
+
+class ExportTest(CatalogueTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        OrderItem.objects.create(user=cls.user, product=cls.product, quantity=2)
+        cls.order = Order.objects.create(user=cls.user)
+
+    def test_export_uses_the_line_snapshot(self):
+        self.product.name_en = 'Renamed'
+        self.product.price = 99
+        self.product.save()
+
+        [row] = export_rows()
+
+        self.assertEqual(row['product'], 'Margherita')
+        self.assertEqual(row['unit_price'], Decimal('10.00'))
+        self.assertEqual(row['total'], Decimal('20.00'))
+        self.assertEqual(row['username'], 'customer')
+
+    def test_deleting_a_product_keeps_its_order_history(self):
+        cart_line = OrderItem.objects.create(user=self.user, product=self.product, quantity=1)
+        self.product.delete()
+
+        [row] = export_rows()
+        self.assertEqual((row['product_id'], row['product']), (None, 'Margherita'))
+        self.assertFalse(OrderItem.objects.filter(pk=cart_line.pk).exists())
+
+        order = self.client.get('/api/orders/').data['orders'][0]
+        self.assertEqual(order['order_items'][0]['product']['id'], None)
+        self.assertEqual(order['order_items'][0]['product']['name_en'], 'Margherita')
+
+    def test_order_lines_keep_the_product_keys(self):
+        line = self.client.get('/api/orders/').data['orders'][0]['order_items'][0]
+
+        self.assertEqual(list(line['product']), ['id', 'name_en', 'name_hu', 'thumbnail', 'is_best', 'price', 'discount', 'new_price'])
+
+    def test_csv_export_endpoint_streams_rows(self):
+        admin = User.objects.create_superuser(username='admin', phone_number='+36000000009', password='x')
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        response = client.get('/api/exports/orders/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lines[0].split(','), list(EXPORT_FIELDS))
+        self.assertEqual(len(lines), 2)
+
+
+
+class ReportTest(CatalogueTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser(username='admin', phone_number='+36000000009', password='x')
+        OrderItem.objects.create(user=cls.user, product=cls.product, quantity=2)
+        order = Order.objects.create(user=cls.user)
+        order.status = Order.Status.COMPLETED
+        order.save()
+        cls.today = str(timezone.localdate(order.closed_at))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def test_completed_order_is_reported(self):
+        daily = self.client.get('/api/reports/').data['daily']
+        products = self.client.get('/api/reports/products/').data['products']
+        categories = self.client.get('/api/reports/categories/').data['categories']
+
+        self.assertEqual([(row['date'], row['revenue'], row['quantity'], row['orders']) for row in daily],
+                         [(self.today, '20.00', 2, 1)])
+        self.assertEqual([(row['product'], row['name_en'], row['revenue']) for row in products],
+                         [(self.product.pk, 'Margherita', '20.00')])
+        self.assertEqual([(row['category'], row['revenue']) for row in categories],
+                         [(self.category.pk, '20.00')])
+
+    def test_backfill_matches_the_live_rollups(self):
+        before = self.client.get('/api/reports/').data['daily']
+
+        backfill()
+
+        self.assertEqual(self.client.get('/api/reports/').data['daily'], before)
+
+    def test_date_filter(self):
+        self.assertEqual(self.client.get('/api/reports/', {'until': '2000-01-01'}).data['daily'], [])
+        self.assertEqual(len(self.client.get('/api/reports/', {'since': self.today}).data['daily']), 1)
+
+    def test_reports_are_for_admins_only(self):
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(self.client.get('/api/reports/').status_code, 403)
+
+
+class ProductImportTest(CatalogueTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser(username='admin', phone_number='+36000000009', password='x')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def new_row(self, **values):
+        return {'name_en': 'Diavola',
+                'name_hu': 'Diavola',
+                'description_en': 'Salami',
+                'description_hu': 'Szalámi',
+                'thumbnail': 'thumbnail.jpg',
+                'image': 'image.jpg',
+                'price': '12.50',
+                'discount': '20',
+                'category': str(self.category.pk),
+                **values}
+
+    def test_creates_and_updates_products(self):
+        version = catalogue_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = import_products([self.new_row(), {'id': self.product.pk, 'price': '11'}])
+
+        self.assertTrue(report['applied'])
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (1, 1, 0))
+        created = Product.objects.get(name_en='Diavola')
+        self.assertEqual(created.new_price, Decimal('10.00'))
+        self.assertEqual(ProductPrice.objects.get(product=created).price, Decimal('10.00'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal('11.00'))
+        self.assertEqual(catalogue_version(), version + 1)
+
+    def test_failed_price_refresh_rolls_the_import_back(self):
+        with mock.patch('app.product_import.refresh_prices', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            import_products([self.new_row()])
+
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_dry_run_reports_without_applying(self):
+        report = import_products([self.new_row(), {'id': self.product.pk, 'price': '11'}], dry_run=True)
+
+        self.assertFalse(report['applied'])
+        [change] = report['changes']
+        self.assertEqual(change['id'], self.product.pk)
+        self.assertEqual(change['changes']['price'], [Decimal('10.00'), Decimal('11.00')])
+        self.assertEqual(change['changes']['new_price'], [Decimal('10.00'), Decimal('11.00')])
+        self.assertEqual(Product.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal('10.00'))
+
+    def test_unchanged_rows_are_not_written(self):
+        report = import_products([{'id': self.product.pk, 'price': '10'}])
+
+        self.assertEqual((report['updated'], report['unchanged']), (0, 1))
+
+    def test_any_invalid_row_rejects_the_whole_import(self):
+        report = import_products([self.new_row(),
+                                  self.new_row(price='free', category='999'),
+                                  {'id': 999999, 'price': '1'},
+                                  {'name_en': 'Half'}])
+
+        self.assertFalse(report['applied'])
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4])
+        self.assertEqual(report['errors'][0]['errors'], {'price': 'Not a number.', 'category': 'Category does not exist.'})
+        self.assertEqual(report['errors'][1]['errors'], {'id': 'Product does not exist.'})
+        self.assertIn('price', report['errors'][2]['errors'])
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_parses_csv_and_rejects_bad_json(self):
+        rows = parse_rows(b'\xef\xbb\xbfid,price\r\n1,11\r\n', 'csv')
+
+        self.assertEqual(rows, [{'id': '1', 'price': '11'}])
+        with self.assertRaises(ProductImportError):
+            parse_rows('{"id": 1}', 'json')
+        with self.assertRaisesMessage(ProductImportError, 'Row 2 is not an object.'):
+            parse_rows('[{"id": 1}, 2]', 'json')
+
+    def test_endpoint_returns_400_with_the_report_on_errors(self):
+        response = self.client.post('/api/product_import/', [{'id': self.product.pk, 'discount': '150'}], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['report']['errors'], [{'row': 1, 'errors': {'discount': 'Must be between 0 and 100.'}}])
+
+    def test_endpoint_rejects_rows_that_are_not_objects(self):
+        response = self.client.post('/api/product_import/', [{'id': self.product.pk}, 1, 'x'], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Row 2 is not an object.'})
+
+
+class CatalogueSyncTest(CatalogueTestCase):
+
+    def sync(self, since):
+        response = self.client.get('/api/catalogue/changes/', {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_sync_then_only_later_changes(self):
+        first = self.sync(0)
+
+        self.assertEqual([product['id'] for product in first['products']], [self.product.pk])
+        self.assertEqual([category['id'] for category in first['categories']], [self.category.pk])
+        self.assertFalse(first['more'])
+
+        self.product.price = 12
+        self.product.save()
+        second = self.sync(first['sequence'])
+
+        self.assertEqual([product['id'] for product in second['products']], [self.product.pk])
+        self.assertEqual(second['categories'], [])
+        self.assertEqual(self.sync(second['sequence'])['products'], [])
+
+    def test_deleted_and_deactivated_products_are_removed(self):
+        since = self.sync(0)['sequence']
+        product_id = self.product.pk
+        other = create_product(self.category, name_en='Diavola')
+        self.product.delete()
+        other.is_active = False
+        other.save()
+
+        changes = self.sync(since)
+
+        self.assertEqual(changes['products'], [])
+        self.assertEqual(changes['deleted']['products'], sorted([product_id, other.pk]))
+
+    def test_pages_are_capped(self):
+        with mock.patch('app.changes.CHANGES_PAGE_SIZE', 1):
+            first = self.sync(0)
+            second = self.sync(first['sequence'])
+
+        self.assertTrue(first['more'])
+        self.assertEqual(len(first['categories']) + len(first['products']), 1)
+        self.assertEqual(len(second['categories']) + len(second['products']), 1)
+
+    def test_invalid_since_is_rejected(self):
+        response = self.client.get('/api/catalogue/changes/', {'since': 'yesterday'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class SingleflightTest(CatalogueTestCase):
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'built': len(calls)}
+
+        def fetch():
+            barrier.wait()
+            results.append(singleflight.get_or_build('test:key', 1, build))
+
+        results = []
+        threads = [threading.Thread(target=fetch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'built': 1}] * 8)
+
+    def test_new_version_is_rebuilt(self):
+        self.assertEqual(singleflight.get_or_build('test:key', 1, lambda: 'old'), 'old')
+        self.assertEqual(singleflight.get_or_build('test:key', 1, lambda: 'new'), 'old')
+        self.assertEqual(singleflight.get_or_build('test:key', 2, lambda: 'new'), 'new')
+
+    def test_missing_and_inactive_products_are_404_and_cached(self):
+        inactive = create_product(self.category, name_en='Diavola', is_active=False)
+
+        for url in ['/api/products/999999/product/', f'/api/products/{inactive.pk}/product/', '/api/products/abc/product/']:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_reactivated_product_is_served(self):
+        url = f'/api/products/{self.product.pk}/product/'
+        Product.objects.filter(pk=self.product.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.product.save()
+
+        self.assertEqual(self.client.get(url).data['product']['id'], self.product.pk)
+
+
+class BenchmarkTest(TestCase):
+
+    def test_herd_without_products_fails_cleanly(self):
+        with self.assertRaisesMessage(CommandError, 'herd needs an active product'):
+            call_command('benchmark', 'herd', repeat=2, stdout=StringIO())
+
+
+class BrowserOnlyMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.middleware = BrowserOnlyMiddleware(lambda request: HttpResponse())
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        return HttpResponse()
+
+    def test_browser_posts_without_a_csrf_token_are_rejected(self):
+        request = self.factory.post('/accounts/form/')
+
+        response = self.middleware.process_view(request, self.view, (), {})
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_api_requests_skip_the_browser_middleware(self):
+        request = self.factory.post('/api/orders/')
+
+        self.assertIsNone(self.middleware.process_view(request, self.view, (), {}))
+        self.assertNotIn('X-Frame-Options', self.middleware(request))
+        self.assertEqual(self.middleware(self.factory.get('/admin/'))['X-Frame-Options'], 'DENY')
+
+
+class LanguageTest(CatalogueTestCase):
+
+    def test_parse_accept_language_orders_by_quality(self):
+        self.assertEqual(parse_accept_language('hu-HU,hu;q=0.9,en;q=0.8'), ['hu', 'hu', 'en'])
+        self.assertEqual(parse_accept_language('en;q=0.5, hu'), ['hu', 'en'])
+        self.assertEqual(parse_accept_language('de;q=x, en;q=0, hu;q=0.1'), ['hu'])
+
+    def menu(self, **extra):
+        response = self.client.get('/api/menu/', **extra)
+        self.assertIn('Accept-Language', response['Vary'])
+        return response.data['menu'][0]
+
+    def test_lang_parameter_keeps_one_language(self):
+        category = self.menu(QUERY_STRING='lang=hu')
+
+        self.assertEqual(category['name_hu'], 'Pizza')
+        self.assertNotIn('name_en', category)
+        self.assertNotIn('name_en', category['products'][0])
+
+    def test_accept_language_picks_a_supported_language(self):
+        category = self.menu(HTTP_ACCEPT_LANGUAGE='de-DE,de;q=0.9,en;q=0.8,hu;q=0.5')
+
+        self.assertIn('name_en', category)
+        self.assertNotIn('name_hu', category)
+
+    def test_without_a_choice_both_languages_are_served(self):
+        category = self.menu(QUERY_STRING='lang=de')
+
+        self.assertIn('name_en', category)
+        self.assertIn('name_hu', category)
+
+    def test_payloads_are_cached_per_language(self):
+        self.menu(QUERY_STRING='lang=hu')
+
+        self.assertNotIn('name_hu', self.menu(QUERY_STRING='lang=en'))
+
+
+class FieldsetTest(CatalogueTestCase):
+
+    product_fields = {'discount': 10}
+
+    def request(self, query):
+        return SimpleNamespace(query_params=dict(item.split('=') for item in query.split('&')))
+
+    def test_requested_fields(self):
+        self.assertIsNone(requested_fields(SimpleNamespace(query_params={})))
+        self.assertEqual(requested_fields(self.request('fields=name_en,bogus')), {'id', 'name_en'})
+        self.assertEqual(requested_fields(self.request('compact=1&fields=image')), set(COMPACT_PRODUCT_FIELDS))
+
+    def product_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries if 'FROM "app_product"' in query['sql']]
+
+    def test_compact_menu_reads_only_the_compact_columns(self):
+        response, [sql] = self.product_queries('/api/menu/?compact=1')
+
+        self.assertEqual(set(response.data['menu'][0]['products'][0]), set(COMPACT_PRODUCT_FIELDS))
+        self.assertNotIn('"description_en"', sql)
+        self.assertNotIn('app_productprice', sql)
+
+    def test_price_fields_bring_the_effective_price(self):
+        response, [sql] = self.product_queries('/api/menu/?fields=new_price')
+
+        self.assertEqual(response.data['menu'][0]['products'][0], {'id': self.product.pk, 'new_price': '9.00'})
+        self.assertIn('app_productprice', sql)
+        self.assertNotIn('"description_en"', sql)
+
+    def test_full_payload_is_unchanged(self):
+        product = self.client.get('/api/menu/').data['menu'][0]['products'][0]
+
+        self.assertTrue({'id', 'name_en', 'name_hu', 'thumbnail', 'price', 'discount', 'new_price'} <= set(product))
+
+
+class HomeTest(CatalogueTestCase):
+
+    product_fields = {'is_best': True}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Banner.objects.create(name_en='Banner', name_hu='Banner', image='banner.jpg', queue=1)
+        cls.discounted = create_product(cls.category, name_en='Diavola', discount=20)
+        create_product(cls.category, name_en='Hawaii', discount=30, is_best=True)
+
+    def test_home_composes_the_startup_payloads(self):
+        home = self.client.get('/api/home/').data
+
+        self.assertEqual(set(home), {'banners', 'catalogue', 'news', 'discounts'})
+        self.assertEqual([banner['name_en'] for banner in home['banners']], ['Banner'])
+        self.assertEqual([category['id'] for category in home['catalogue']], [self.category.pk])
+        self.assertEqual({product['name_en'] for product in home['news']}, {'Margherita', 'Hawaii'})
+        self.assertEqual({product['name_en'] for product in home['discounts']}, {'Diavola', 'Hawaii'})
+
+    def test_carousels_are_capped_at_a_page(self):
+        with mock.patch.object(NewDiscountProductPagination, 'page_size', 1):
+            home = self.client.get('/api/home/').data
+
+        self.assertEqual((len(home['news']), len(home['discounts'])), (1, 1))
+
+    def test_home_is_served_from_the_catalogue_cache(self):
+        self.client.get('/api/home/?compact=1&lang=en')
+
+        with self.assertNumQueries(0):
+            home = self.client.get('/api/home/?compact=1&lang=en').data
+
+        self.assertEqual(set(home['news'][0]), set(COMPACT_PRODUCT_FIELDS) - {'name_hu'})
+
+
+class WarmupTest(CatalogueTestCase):
+
+    def test_warm_up_runs_every_step(self):
+        self.assertEqual(list(warm_up()), list(WARMUP_STEPS))
+        self.assertEqual(list(warm_up(['modules'])), ['modules'])
+
+    def test_warmed_payloads_need_no_queries(self):
+        warm_up(['payloads'])
+
+        with self.assertNumQueries(0):
+            for url in ['/api/menu/', '/api/menu/?compact=1&lang=hu', '/api/catalogue_in_header/?lang=en', '/api/banner/']:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_command_reports_the_steps(self):
+        out = StringIO()
+
+        call_command('warmup', step=['connections'], stdout=out)
+
+        self.assertIn('connections', out.getvalue())
+        self.assertIn('Warmed up', out.getvalue())
+
+
+class LoggingTest(CatalogueTestCase):
+
+    def test_json_formatter_keeps_extra_fields(self):
+        record = logging.makeLogRecord({'name': 'app', 'levelname': 'WARNING', 'msg': 'Paid %s', 'args': ('10.00',),
+                                        'request_id': 'abc', 'order_id': 7})
+
+        data = json.loads(log.JsonFormatter().format(record))
+
+        self.assertEqual(data['message'], 'Paid 10.00')
+        self.assertEqual((data['level'], data['logger'], data['request_id'], data['order_id']), ('WARNING', 'app', 'abc', 7))
+
+    def test_request_ids_are_reused_only_when_safe(self):
+        self.assertEqual(log.clean_request_id('req-1.2:3_x'), 'req-1.2:3_x')
+        for value in [None, '', 'a b', 'x' * 65, 'evil\n{"level": "ERROR"}']:
+            self.assertRegex(log.clean_request_id(value), r'^[0-9a-f]{32}$')
+
+    def test_responses_carry_the_request_id(self):
+        self.assertEqual(self.client.get('/api/banner/', HTTP_X_REQUEST_ID='req-1')['X-Request-ID'], 'req-1')
+        self.assertNotEqual(self.client.get('/api/banner/', HTTP_X_REQUEST_ID='a b')['X-Request-ID'], 'a b')
+
+    def test_slow_queries_are_sampled_without_parameters(self):
+        with mock.patch('app.log.SLOW_QUERY_MS', 0), mock.patch('app.log.SLOW_QUERY_SAMPLE_RATE', 1):
+            with self.assertLogs('app.slow_query', 'WARNING') as logs:
+                self.client.get(f'/api/products/{self.product.pk}/product/', HTTP_X_REQUEST_ID='req-2')
+
+        record = logs.records[0]
+        self.assertIn('app_product', record.sql)
+        self.assertEqual(record.database, 'default')
+        self.assertTrue(any(frame.startswith('app/') for frame in record.stack))
+        self.assertFalse(hasattr(record, 'params'))
+
+    def test_unsampled_slow_queries_are_not_logged(self):
+        with mock.patch('app.log.SLOW_QUERY_MS', 0), mock.patch('app.log.SLOW_QUERY_SAMPLE_RATE', 0):
+            with self.assertNoLogs('app.slow_query'):
+                self.client.get('/api/banner/')
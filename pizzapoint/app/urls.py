@@ -1,15 +1,14 @@
 from django.urls import path, include
 from rest_framework import routers
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
 from django.contrib.auth import views as auth_views
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
 
 from .views import (CatalogueInHeaderViewSet,
                     BannerViewSet,
                     NewProductVuewSet,
                     DiscountProductVuewSet,
+                    HomeViewSet,
                     MenuViewSet,
                     UserViewSet,
                     CatalogueViewSet,
@@ -17,7 +16,24 @@ from .views import (CatalogueInHeaderViewSet,
                     OrderItemViewSet,
                     OrderViewSet,
                     ActiveOrderViewSet,
-                    CompletedOrderViewSet)
+                    CompletedOrderViewSet,
+                    ReportViewSet,
+                    ExportViewSet,
+                    ProductImportViewSet,
+                    metrics_view)
+
+
+def lazy_view(dotted_path):
+
+    # Defers importing the view (and its dependencies, e.g. simplejwt and
+    # PyJWT) until the first request that needs it.
+    @csrf_exempt
+    def view(request, *args, **kwargs):
+        if not hasattr(view, 'resolved'):
+            view.resolved = import_string(dotted_path).as_view()
+        return view.resolved(request, *args, **kwargs)
+
+    return view
 
 
 router = routers.DefaultRouter()
@@ -25,6 +41,7 @@ router.register(r'catalogue_in_header', CatalogueInHeaderViewSet, basename='cata
 router.register(r'banner', BannerViewSet, basename='banner')
 router.register(r'new_product', NewProductVuewSet, basename='new_product')
 router.register(r'discount_product', DiscountProductVuewSet, basename='discount_product')
+router.register(r'home', HomeViewSet, basename='home')
 router.register(r'menu', MenuViewSet, basename='menu')
 router.register(r'user', UserViewSet, basename='user')
 router.register(r'catalogue', CatalogueViewSet, basename='catalogue')
@@ -33,12 +50,17 @@ router.register(r'order_items', OrderItemViewSet, basename='order_items')
 router.register(r'orders', OrderViewSet, basename='orders')
 router.register(r'active_orders', ActiveOrderViewSet, basename='active_orders')
 router.register(r'completed_orders', CompletedOrderViewSet, basename='completed_orders')
+router.register(r'reports', ReportViewSet, basename='reports')
+router.register(r'exports', ExportViewSet, basename='exports')
+router.register(r'product_import', ProductImportViewSet, basename='product_import')
 
 urlpatterns = [
 
     path('api/', include(router.urls)),
 
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/', lazy_view('rest_framework_simplejwt.views.TokenObtainPairView'), name='token_obtain_pair'),
+    path('api/token/refresh/', lazy_view('rest_framework_simplejwt.views.TokenRefreshView'), name='token_refresh'),
+
+    path('metrics', metrics_view, name='metrics'),
     
 ]
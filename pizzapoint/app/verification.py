@@ -0,0 +1,112 @@
+import hashlib
+import hmac
+import logging
+import secrets
+import string
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+CODE_LENGTH = getattr(settings, 'VERIFICATION_CODE_LENGTH', 6)
+CODE_TTL = getattr(settings, 'VERIFICATION_CODE_TTL', 5 * 60)
+MAX_ATTEMPTS = getattr(settings, 'VERIFICATION_MAX_ATTEMPTS', 5)
+# A number gets at most one code per RESEND_INTERVAL seconds and
+# MAX_SENDS codes per SEND_WINDOW, so resends cannot be used to pump SMS
+# or to reset the attempt limit indefinitely.
+RESEND_INTERVAL = getattr(settings, 'VERIFICATION_RESEND_INTERVAL', 60)
+MAX_SENDS = getattr(settings, 'VERIFICATION_MAX_SENDS', 5)
+SEND_WINDOW = getattr(settings, 'VERIFICATION_SEND_WINDOW', 60 * 60)
+
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+LOCKED = 'locked'
+
+
+def code_key(phone_number):
+    return f'verification:{phone_number}'
+
+
+def attempts_key(phone_number):
+    return f'verification:{phone_number}:attempts'
+
+
+def resend_key(phone_number):
+    return f'verification:{phone_number}:resend'
+
+
+def sends_key(phone_number):
+    return f'verification:{phone_number}:sends'
+
+
+def digest(phone_number, code):
+    # Only a keyed hash of the code is stored, so a cache dump does not leak codes.
+    message = f'{phone_number}:{code}'.encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def send_sms(phone_number, body):
+    account_sid = getattr(settings, 'TWILIO_ACCOUNT_SID', None)
+    auth_token = getattr(settings, 'TWILIO_AUTH_TOKEN', None)
+    from_number = getattr(settings, 'TWILIO_FROM_NUMBER', None)
+
+    if not (account_sid and auth_token and from_number):
+        logger.warning('Twilio is not configured, verification SMS to %s was not sent', phone_number)
+        return
+
+    from twilio.rest import Client
+
+    Client(account_sid, auth_token).messages.create(to=phone_number, from_=from_number, body=body)
+
+
+def claim_send(phone_number):
+    if not cache.add(resend_key(phone_number), True, RESEND_INTERVAL):
+        return False
+
+    cache.add(sends_key(phone_number), 0, SEND_WINDOW)
+    try:
+        sends = cache.incr(sends_key(phone_number))
+    except ValueError:
+        sends = 1
+
+    return sends <= MAX_SENDS
+
+
+def issue_code(phone_number):
+    code = ''.join(secrets.choice(string.digits) for _ in range(CODE_LENGTH))
+
+    cache.set(code_key(phone_number), {'digest': digest(phone_number, code),
+                                       'expires_at': time.time() + CODE_TTL}, CODE_TTL)
+    cache.set(attempts_key(phone_number), 0, CODE_TTL)
+
+    send_sms(phone_number, f'Your PizzaPoint verification code is {code}')
+
+    return code
+
+
+def check_code(phone_number, code):
+    record = cache.get(code_key(phone_number))
+
+    if record is None or record['expires_at'] <= time.time():
+        return EXPIRED
+
+    # incr is atomic on Redis (and on LocMem within a process), so
+    # concurrent guesses cannot slip past the limit.
+    try:
+        attempts = cache.incr(attempts_key(phone_number))
+    except ValueError:
+        return EXPIRED
+
+    if attempts > MAX_ATTEMPTS:
+        return LOCKED
+
+    if not hmac.compare_digest(record['digest'], digest(phone_number, str(code))):
+        return INVALID
+
+    cache.delete_many([code_key(phone_number), attempts_key(phone_number)])
+
+    return VERIFIED
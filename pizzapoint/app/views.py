@@ -1,61 +1,93 @@
+import random
+
 from rest_framework import viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import (IsAuthenticated,
+                                        IsAdminUser,
                                         AllowAny)
 from rest_framework.pagination import PageNumberPagination
-
-from .utils import (send_verification_code,
-                    verify_code)
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from . import cart, metrics, verification
+from .archive import order_history
+from .catalogue import (cached_payload,
+                        catalogue_in_header_payload,
+                        catalogue_detail_payload,
+                        banner_payload,
+                        menu_payload,
+                        best_products_payload,
+                        discount_products_payload,
+                        product_payload)
+from .changes import changes_since
+from .concurrency import (ConflictError,
+                          etag,
+                          expect_version)
+from .idempotency import idempotent
+from .routers import ReplicaReadMixin
+from .languages import (requested_language,
+                        vary_on_language)
+from .fieldsets import (requested_fields,
+                        fieldset_key,
+                        sparse_products)
+from .exports import (CONTENT_TYPES,
+                      export_rows,
+                      export_lines)
+from .product_import import (ProductImportError,
+                             check_rows,
+                             parse_rows,
+                             import_products)
 from .models import (User,
-                     Banner,
                      Category,
                      Product,
                      OrderItem,
-                     Order)
+                     Order,
+                     DailySales,
+                     DailyProductSales,
+                     DailyCategorySales)
 from .serializers import (UserSerializer,
-                          BannerSerializer,
-                          CatalogueSerializer,
-                          CatalogueWithImageSerializer,
-                          MenuSerializer,
                           MenuWithoutIdSerializer,
                           ProductItemSerializer,
-                          ProductSerializer,
                           OrderItemSerializer,
                           CreateOrderItemSerializer,
                           OrderSerializer,
                           CreateOrderSerializer,
-                          OrderStatusSerializer)
+                          OrderStatusSerializer,
+                          DailySalesSerializer,
+                          DailyProductSalesSerializer,
+                          DailyCategorySalesSerializer)
 
 
-class CatalogueInHeaderViewSet(viewsets.ViewSet):
+class CatalogueInHeaderViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
 
     def list(self, request):
 
-        catalogue_objects = Category.objects.all().order_by('queue')
-        catalogue_data = CatalogueSerializer(catalogue_objects, many=True).data
+        catalogue_data = catalogue_in_header_payload(requested_language(request))
 
-        return Response({
+        return vary_on_language(Response({
             'catalogue': catalogue_data
-        })
+        }))
 
 
-class BannerViewSet(viewsets.ViewSet):
+class BannerViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
     from rest_framework.pagination import PageNumberPagination
     def list(self, request):
 
-        banner_objects = Banner.objects.all().order_by('queue')
-        banner_data = BannerSerializer(banner_objects, many=True).data
+        banner_data = banner_payload(requested_language(request))
 
-        return Response({
+        return vary_on_language(Response({
             'banners': banner_data,
-        })
+        }))
 
 
 class NewDiscountProductPagination(PageNumberPagination):
@@ -63,53 +95,77 @@ class NewDiscountProductPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
 
 
-class NewProductVuewSet(viewsets.ViewSet):
+class NewProductVuewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
 
     def list(self, request):
 
-        best_objects = Product.objects.filter(is_best = True, is_active = True).order_by('?')
+        fields = requested_fields(request)
+
+        best_objects = sparse_products(Product.objects.filter(is_best = True, is_active = True), fields).order_by('?')
         paginator = NewDiscountProductPagination()
         paginated_best_objects = paginator.paginate_queryset(best_objects, request) 
 
         
-        best_data = ProductItemSerializer(paginated_best_objects, many=True).data
+        best_data = ProductItemSerializer(paginated_best_objects, many=True, context={'lang': requested_language(request), 'fields': fields}).data
         
-        return Response({
+        return vary_on_language(Response({
             'news': best_data,
-        })
+        }))
 
 
-class DiscountProductVuewSet(viewsets.ViewSet):
+class DiscountProductVuewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
 
     def list(self, request):
     
-        discout_objects = Product.objects.filter(discount__gt = 0, is_active = True).order_by('?')
+        fields = requested_fields(request)
+
+        discout_objects = sparse_products(Product.objects.filter(effective_price__discount__gt = 0, is_active = True), fields).order_by('?')
         paginator = NewDiscountProductPagination()
         paginated_discount_data = paginator.paginate_queryset(discout_objects, request) 
 
-        discount_data = ProductItemSerializer(paginated_discount_data, many=True).data
+        discount_data = ProductItemSerializer(paginated_discount_data, many=True, context={'lang': requested_language(request), 'fields': fields}).data
 
-        return Response({
+        return vary_on_language(Response({
             'discounts': discount_data,
-        })
+        }))
+
+
+class HomeViewSet(ReplicaReadMixin, viewsets.ViewSet):
+
+    permission_classes = [AllowAny]
+
+    def list(self, request):
 
+        lang = requested_language(request)
+        fields = requested_fields(request)
+        page_size = NewDiscountProductPagination.page_size
 
-class MenuViewSet(viewsets.ViewSet):
+        best_data = best_products_payload(lang, fields)
+        discount_data = discount_products_payload(lang, fields)
+
+        return vary_on_language(Response({
+            'banners': banner_payload(lang),
+            'catalogue': catalogue_in_header_payload(lang),
+            'news': random.sample(best_data, min(page_size, len(best_data))),
+            'discounts': random.sample(discount_data, min(page_size, len(discount_data))),
+        }))
+
+
+class MenuViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
 
     def list(self, request):
 
-        menu_objects = Category.objects.all().order_by('queue')
-        menu_data = MenuSerializer(menu_objects, many=True).data
+        menu_data = menu_payload(requested_language(request), requested_fields(request))
         
-        return Response({
+        return vary_on_language(Response({
             'menu': menu_data
-        })
+        }))
 
 
 class UserViewSet(viewsets.ViewSet):
@@ -124,78 +180,129 @@ class UserViewSet(viewsets.ViewSet):
 
         return Response({'profile': user_data})
 
-    @action(methods=['post'], detail=False)
+    @action(methods=['post'], detail=False, permission_classes=[AllowAny])
     def register(self, request):
 
         phone_number = request.data.get('phone_number')
         username = request.data.get('username')
 
-        if User.objects.filter(phone_number=phone_number).exists():
-            return Response({'message': 'User with this phone number already exists'}, status=status.HTTP_400_BAD_REQUEST)
+        if not phone_number or not username:
+            return Response({'message': 'Phone number and username are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = User.objects.create_user(username=username, phone_number=phone_number)
+        # The unique constraints decide; no check-then-insert round trip.
+        try:
+            with transaction.atomic():
+                User.objects.create_user(username=username, phone_number=phone_number)
+        except IntegrityError:
+            return Response({'message': 'User with this phone number or username already exists'}, status=status.HTTP_400_BAD_REQUEST)
 
-        send_verification_code(phone_number)
+        verification.claim_send(phone_number)
+        verification.issue_code(phone_number)
 
         return Response({'message': 'Verification code sent'}, status=status.HTTP_201_CREATED)
 
-    @action(methods=['post'], detail=False)
+    @action(methods=['post'], detail=False, permission_classes=[AllowAny])
+    def resend(self, request):
+
+        phone_number = request.data.get('phone_number')
+
+        if not User.objects.filter(phone_number=phone_number).exists():
+            return Response({'message': 'Invalid phone number'}, status=status.HTTP_404_NOT_FOUND)
+
+        if not verification.claim_send(phone_number):
+            response = Response({'message': 'Too many verification codes requested'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(verification.RESEND_INTERVAL)
+            return response
+
+        verification.issue_code(phone_number)
+
+        return Response({'message': 'Verification code sent'})
+
+    @action(methods=['post'], detail=False, permission_classes=[AllowAny])
     def verify(self, request):
 
         phone_number = request.data.get('phone_number')
         code = request.data.get('code')
 
-        user = User.objects.filter(phone_number=phone_number).first()
+        user = User.objects.filter(phone_number=phone_number).only('id', 'password', 'is_phone_verified').first()
 
         if not user:
             return Response({'message': 'Invalid phone number'}, status=status.HTTP_404_NOT_FOUND)
 
-        if verify_code(phone_number, code):
+        result = verification.check_code(phone_number, code)
+
+        if result == verification.VERIFIED:
 
-            user.is_phone_verified = True
-            user.save()
+            if not user.is_phone_verified:
+                user.is_phone_verified = True
+                user.save(update_fields=['is_phone_verified'])
 
             token, created = Token.objects.get_or_create(user=user)
 
             return Response({'message': 'Phone number verified', 'token': token.key})
 
+        if result == verification.EXPIRED:
+            return Response({'message': 'Verification code expired'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if result == verification.LOCKED:
+            return Response({'message': 'Too many attempts'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
         return Response({'message': 'Invalid verification code'}, status=status.HTTP_400_BAD_REQUEST)
     
 
-class CatalogueViewSet(viewsets.ViewSet):
+class CatalogueViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
 
     def list(self, request):
 
-        category_detail_objects = Category.objects.all().order_by('queue')
+        category_detal_data = catalogue_detail_payload(requested_language(request))
 
-        category_detal_data = CatalogueWithImageSerializer(category_detail_objects, many=True).data
+        return vary_on_language(Response({'catalogue_detail': category_detal_data}))
 
-        return Response({'catalogue_detail': category_detal_data})
+    @action(methods=['get'], detail=False)
+    def changes(self, request):
+
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({'error': 'since must be a sequence number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return vary_on_language(Response(changes_since(max(since, 0), requested_language(request))))
 
     @action(methods=['get'], detail=True)
     def menu(self, request, pk=None):
 
-        menu_objects = Category.objects.get(pk=pk)
+        lang = requested_language(request)
+        fields = requested_fields(request)
 
-        menu_data = MenuWithoutIdSerializer(menu_objects).data
+        def build():
+            menu_objects = Category.objects.prefetch_related(Prefetch('products', queryset=sparse_products(Product.objects.all(), fields))).get(pk=pk)
+            return MenuWithoutIdSerializer(menu_objects, context={'lang': lang, 'fields': fields}).data
 
-        return Response({'products of menu': menu_data})
+        menu_data = cached_payload(fieldset_key(f'category_menu:{pk}', fields), lang, build)
 
+        return vary_on_language(Response({'products of menu': menu_data}))
 
-class ProductsViewSet(viewsets.ViewSet):
+
+class ProductsViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [AllowAny]
 
     @action(methods=['get'], detail=True)
     def product(self, request, pk=None):
-        product_objects = Product.objects.get(pk=pk)
-        product_data = ProductSerializer(product_objects).data
 
-        return Response({
+        lang = requested_language(request)
+        fields = requested_fields(request)
+
+        product_data = product_payload(pk, lang, fields)
+
+        if product_data is None:
+            raise Http404
+
+        return vary_on_language(Response({
             'product': product_data
-        })
+        }))
     
 
 class OrderItemViewSet(viewsets.ViewSet):
@@ -204,12 +311,9 @@ class OrderItemViewSet(viewsets.ViewSet):
     
     def list(self, request):
 
-        order_items_objects = OrderItem.objects.filter(user=request.user, status__in=[OrderItem.Status.PENDING])
-
-        orders_items_data = OrderItemSerializer(order_items_objects, many=True).data
-
-        return Response({'order_items': orders_items_data})
+        return Response(cart.get_cart(request.user.pk))
     
+    @idempotent
     def create(self, request):
 
         serializer = CreateOrderItemSerializer(data=request.data)
@@ -217,12 +321,14 @@ class OrderItemViewSet(viewsets.ViewSet):
         if serializer.is_valid():
 
             serializer.save(user=request.user)
+            cart.update_cart(request.user.pk)
 
             return Response({'order_item': serializer.data}, status=status.HTTP_201_CREATED)
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(methods=['get', 'delete', 'patch'], detail=True)
+    @idempotent
     def order_item(self, request, pk=None):
 
         try:
@@ -232,30 +338,39 @@ class OrderItemViewSet(viewsets.ViewSet):
             
         if request.method == 'GET':
             order_item_data = OrderItemSerializer(order_item_object).data
-            return Response({'order_item': order_item_data})
+            return Response({'order_item': order_item_data}, headers={'ETag': etag(order_item_object)})
             
         if request.method == 'DELETE':
             order_item_object.delete()
+            cart.update_cart(request.user.pk)
             return Response({'message': 'Order item deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
             
         if request.method == 'PATCH':
             order_item_data = OrderItemSerializer(order_item_object, data=request.data, partial=True)
             if order_item_data.is_valid():
-                order_item_data.save()
-                return Response({'order_item': order_item_data.data})
+                expect_version(order_item_object, request)
+                try:
+                    with transaction.atomic():
+                        order_item_data.save()
+                except ConflictError:
+                    return Response({'error': 'Order item was changed by someone else'}, status=status.HTTP_409_CONFLICT)
+                if order_item_object.status == OrderItem.Status.PENDING:
+                    cart.update_cart(request.user.pk)
+                return Response({'order_item': order_item_data.data}, headers={'ETag': etag(order_item_object)})
+            return Response(order_item_data.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class OrderViewSet(viewsets.ViewSet):
+class OrderViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
 
-        orders_objects = Order.objects.filter(user=request.user, status__in=[Order.Status.ACTIVE, Order.Status.COMPLETED])
-        orders_data = OrderSerializer(orders_objects, many=True).data
+        orders_data = order_history(request.user, [Order.Status.ACTIVE, Order.Status.COMPLETED])
 
         return Response({'orders': orders_data})
     
+    @idempotent
     def create(self, request):
 
         serializer = CreateOrderSerializer(data=request.data)
@@ -271,7 +386,7 @@ class OrderViewSet(viewsets.ViewSet):
     
 
 
-class ActiveOrderViewSet(viewsets.ViewSet):
+class ActiveOrderViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [IsAuthenticated]
 
@@ -283,32 +398,141 @@ class ActiveOrderViewSet(viewsets.ViewSet):
         return Response({'active_orders': active_orders_data})
     
     @action(methods=['get', 'patch'], detail=True, url_path='order')
-
+    @idempotent
     def order(self, request, pk=None):
-        active_orders_objects = Order.objects.get(pk=pk, user=request.user, status__in=[Order.Status.ACTIVE])
+
+        try:
+            active_orders_objects = Order.objects.get(pk=pk, user=request.user, status__in=[Order.Status.ACTIVE])
+        except Order.DoesNotExist:
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
         
         if request.method == 'GET':
 
             order_data = OrderSerializer(active_orders_objects).data
 
-            return Response({'order': order_data})
+            return Response({'order': order_data}, headers={'ETag': etag(active_orders_objects)})
         
         elif request.method == 'PATCH':
                 
             serializer = OrderStatusSerializer(active_orders_objects, data=request.data, partial=True)
             order_data = OrderSerializer(active_orders_objects).data
             if serializer.is_valid():
-                serializer.save()
-                return Response({'message': 'Status updated successfully', 'order': order_data})
+                expect_version(active_orders_objects, request)
+                try:
+                    with transaction.atomic():
+                        serializer.save()
+                except ConflictError:
+                    return Response({'error': 'Order was changed by someone else'}, status=status.HTTP_409_CONFLICT)
+                except ValidationError as error:
+                    return Response({'error': ' '.join(error.messages)}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({'message': 'Status updated successfully', 'order': order_data}, headers={'ETag': etag(active_orders_objects)})
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-class CompletedOrderViewSet(viewsets.ViewSet):
+class CompletedOrderViewSet(ReplicaReadMixin, viewsets.ViewSet):
 
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
 
-        completed_orders_objects = Order.objects.filter(user=request.user, status__in=[Order.Status.COMPLETED])
-        completed_orders_data = OrderSerializer(completed_orders_objects, many=True).data
+        completed_orders_data = order_history(request.user, [Order.Status.COMPLETED])
 
         return Response({'completed_orders': completed_orders_data})
+
+
+class ReportViewSet(viewsets.ViewSet):
+
+    permission_classes = [IsAdminUser]
+
+    def filter_by_date(self, queryset, request):
+
+        since = parse_date(request.query_params.get('since', ''))
+        until = parse_date(request.query_params.get('until', ''))
+
+        if since:
+            queryset = queryset.filter(date__gte=since)
+        if until:
+            queryset = queryset.filter(date__lte=until)
+
+        return queryset
+
+    def list(self, request):
+
+        daily_objects = self.filter_by_date(DailySales.objects.order_by('date'), request)
+        daily_data = DailySalesSerializer(daily_objects, many=True).data
+
+        return Response({'daily': daily_data})
+
+    @action(methods=['get'], detail=False)
+    def products(self, request):
+
+        product_objects = self.filter_by_date(DailyProductSales.objects.select_related('product').order_by('date', 'product'), request)
+        product_data = DailyProductSalesSerializer(product_objects, many=True).data
+
+        return Response({'products': product_data})
+
+    @action(methods=['get'], detail=False)
+    def categories(self, request):
+
+        category_objects = self.filter_by_date(DailyCategorySales.objects.select_related('category').order_by('date', 'category'), request)
+        category_data = DailyCategorySalesSerializer(category_objects, many=True).data
+
+        return Response({'categories': category_data})
+
+
+class ExportViewSet(viewsets.ViewSet):
+
+    permission_classes = [IsAdminUser]
+
+    @action(methods=['get'], detail=False)
+    def orders(self, request):
+
+        export_format = request.query_params.get('type', 'csv')
+
+        if export_format not in CONTENT_TYPES:
+            return Response({'error': 'Unsupported export type'}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = parse_date(request.query_params.get('since', ''))
+        until = parse_date(request.query_params.get('until', ''))
+
+        rows = export_rows(since=since, until=until)
+        response = StreamingHttpResponse(export_lines(export_format, rows), content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+
+        return response
+
+
+class ProductImportViewSet(viewsets.ViewSet):
+
+    permission_classes = [IsAdminUser]
+
+    def create(self, request):
+
+        dry_run = request.query_params.get('dry_run') in ['1', 'true']
+        upload = request.FILES.get('file')
+
+        try:
+            if upload:
+                file_format = upload.name.rsplit('.', 1)[-1].lower()
+                rows = parse_rows(upload.read(), file_format)
+            elif isinstance(request.data, list):
+                rows = check_rows(request.data)
+            else:
+                return Response({'error': 'Send a JSON list or a CSV/JSON file'}, status=status.HTTP_400_BAD_REQUEST)
+        except ProductImportError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = import_products(rows, dry_run=dry_run)
+
+        if report['errors']:
+            return Response({'report': report}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'report': report})
+
+
+def metrics_view(request):
+
+    # Scraped by a Prometheus agent; hidden from everyone else.
+    if not metrics.scrape_allowed(request):
+        raise Http404
+
+    return HttpResponse(metrics.exposition(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
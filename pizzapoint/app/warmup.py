@@ -0,0 +1,52 @@
+import time
+
+from django.db import connections
+from django.urls import get_resolver
+
+from .catalogue import (catalogue_in_header_payload,
+                        catalogue_detail_payload,
+                        banner_payload,
+                        menu_payload,
+                        best_products_payload,
+                        discount_products_payload)
+from .fieldsets import COMPACT_PRODUCT_FIELDS
+from .languages import LANGUAGES
+
+
+def load_modules():
+    # Resolving the URLconf imports every view, serializer and helper module.
+    get_resolver().url_patterns
+
+
+def open_connections():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def render_payloads():
+    # The variants the apps ask for: every language (and none), full and
+    # compact product fields. Home's carousels sample the best/discount payloads.
+    for lang in [None] + LANGUAGES:
+        catalogue_in_header_payload(lang)
+        catalogue_detail_payload(lang)
+        banner_payload(lang)
+        for fields in [None, frozenset(COMPACT_PRODUCT_FIELDS)]:
+            menu_payload(lang, fields)
+            best_products_payload(lang, fields)
+            discount_products_payload(lang, fields)
+
+
+WARMUP_STEPS = {'modules': load_modules,
+                'connections': open_connections,
+                'payloads': render_payloads}
+
+
+def warm_up(steps=None):
+    timings = {}
+
+    for name in steps or WARMUP_STEPS:
+        started = time.perf_counter()
+        WARMUP_STEPS[name]()
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    return timings
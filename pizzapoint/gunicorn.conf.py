@@ -0,0 +1,105 @@
+"""
+Gunicorn configuration for multi-process serving.
+
+    gunicorn -c gunicorn.conf.py
+
+The application is imported once in the master (preload_app) and the
+workers are forked from it, so they share the imported code pages.
+Because of that, SIGHUP only re-forks workers from the code the master
+already holds; it does not pick up a deploy. To load new code without
+dropping connections, send SIGUSR2 to the master (a new master starts
+on the new code next to the old one), then SIGWINCH and SIGQUIT to the
+old master once the new workers are up. Otherwise restart gunicorn.
+
+Environment:
+    PIZZAPOINT_BIND           address to listen on (127.0.0.1:8000)
+    PIZZAPOINT_WORKERS        worker processes (2 * CPU cores + 1)
+    PIZZAPOINT_ASGI           set to 1 to serve pizzapoint.asgi with uvicorn workers (uvicorn-worker)
+    PIZZAPOINT_CACHE_URL      redis:// cache shared by all workers, required with more than one
+    PIZZAPOINT_WARMUP         set to 0 to skip warming up workers before they accept traffic
+"""
+
+import multiprocessing
+import os
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pizzapoint.settings')
+
+bind = os.environ.get('PIZZAPOINT_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('PIZZAPOINT_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Workers must share one cache (catalogue version, idempotency keys,
+# verification attempts, rebuild locks), and it must have atomic add and
+# incr. Per-process LocMem caches drift apart and the file cache is not
+# atomic, so more than one worker needs Redis.
+# PIZZAPOINT_ALLOW_FILE_CACHE=1 accepts a file:// cache anyway, for
+# benchmarks that do not depend on those guarantees.
+CACHE_URL = os.environ.get('PIZZAPOINT_CACHE_URL', '')
+SHARED_CACHE = CACHE_URL.startswith(('redis://', 'rediss://')) or (
+    CACHE_URL.startswith('file://') and os.environ.get('PIZZAPOINT_ALLOW_FILE_CACHE') == '1')
+
+if workers > 1 and not SHARED_CACHE:
+    raise RuntimeError('Set PIZZAPOINT_CACHE_URL=redis://host:6379/0 to run more than one worker '
+                       '(or PIZZAPOINT_WORKERS=1).')
+
+if os.environ.get('PIZZAPOINT_ASGI') == '1':
+    wsgi_app = 'pizzapoint.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'pizzapoint.wsgi:application'
+    worker_class = 'sync'
+
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot accumulate; the
+# jitter keeps them from all restarting at once.
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+WARMUP = os.environ.get('PIZZAPOINT_WARMUP', '1') != '0'
+
+
+def warm_up(server, name, steps):
+    # A failed warm-up only costs the first requests their speed; it must
+    # not keep the worker from booting.
+    from app import warmup
+    try:
+        server.log.info('%s warm-up: %s', name, warmup.warm_up(steps))
+    except Exception:
+        server.log.exception('%s warm-up failed', name)
+
+
+def when_ready(server):
+    # Retire metrics snapshots of workers from a previous run before new
+    # workers are forked and could reuse their PIDs.
+    from app import metrics
+    try:
+        server.log.info('Retired %s stale metrics snapshots', metrics.prune())
+    except OSError:
+        server.log.exception('Pruning %s failed', metrics.METRICS_DIR)
+
+    # Import the views in the master so every worker inherits them.
+    if WARMUP:
+        warm_up(server, 'Master', ['modules'])
+
+
+def post_fork(server, worker):
+    # Connections opened in the master while preloading must not be
+    # shared with the forked workers.
+    from django.db import connections
+    connections.close_all()
+
+    # Runs before the worker accepts connections: open its own database
+    # connections and make sure the catalogue payloads are cached.
+    if WARMUP:
+        warm_up(server, f'Worker {worker.pid}', ['connections', 'payloads'])
+
+
+def worker_exit(server, worker):
+    # Write the last few seconds of metrics before the worker goes away.
+    from app import metrics
+    metrics.flush(force=True)
@@ -0,0 +1,45 @@
+"""
+API-only deployment profile.
+
+Serves /api/ with a minimal middleware chain and without the admin,
+sessions or messages apps. Run the admin from a separate process on the
+default settings. Select with DJANGO_SETTINGS_MODULE=pizzapoint.settings_api.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.staticfiles',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'corsheaders',
+    'app',
+]
+
+MIDDLEWARE = [
+    'app.middleware.RequestLogMiddleware',
+    'app.middleware.MetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+BROWSER_MIDDLEWARE = []
+
+ROOT_URLCONF = 'pizzapoint.urls_api'
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,  # noqa: F405
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.TokenAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+}
+
+TEMPLATES = []